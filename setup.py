@@ -34,7 +34,7 @@ setup(
     python_requires = '>=3.6',
     install_requires = ['pillow', 'pyyaml', 'importlib_resources;python_version<"3.8"'],
     extras_require = {
-        "extra": ["mido>=1.2.9", "requests"]
+        "extra": ["mido>=1.2.9", "requests", "numpy"]
     },
 
     entry_points = {
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+
+class LRUCache():
+    """
+    A least-recently-used cache.
+    The size of the cache is its number of entries, or the sum of get_size(value) over its entries if get_size is given.
+    The least recently used entries are dropped when the size exceeds max_size: None means unbounded, and 0 disables the cache.
+    """
+    def __init__(self, max_size=None, get_size=None):
+        self.max_size = max_size
+        self.get_size = get_size
+        self.entries = OrderedDict() # key -> (value, size)
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            (value, _) = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        size = self.get_size(value) if self.get_size is not None else 1
+        if self.max_size is not None and size > self.max_size:
+            return
+        try:
+            self.total_size -= self.entries[key][1]
+        except KeyError:
+            pass
+        self.entries[key] = (value, size)
+        self.entries.move_to_end(key)
+        self.total_size += size
+        self.evict()
+
+    def resize(self, max_size):
+        self.max_size = max_size
+        self.evict()
+
+    def evict(self):
+        '''Drops the least recently used entries until the cache fits in max_size'''
+        if self.max_size is None:
+            return
+        while self.total_size > self.max_size:
+            (_, (_, size)) = self.entries.popitem(last=False)
+            self.total_size -= size
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'total_size': self.total_size, 'max_size': self.max_size}
+
+    def clear(self):
+        self.entries.clear()
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
@@ -1,15 +1,25 @@
 import re
 from skymusic import notes
+from skymusic.cache import LRUCache
 
 
 class Skygrid():
+    """
+    The notes played on an instrument, stored as one integer bitmask per frame:
+    bit row*columns+column of the mask of a frame is set if the note at (row, column) is highlighted in this frame.
+    Notes outside of the grid (silences) and notes that are not highlighted are kept apart, in the 'others' dict.
+    """
+    __slots__ = ('shape', 'masks', 'others', 'order', 'frame_count', 'num_highlighted', 'is_shared')
     
     def __init__(self, shape=(3,5)):
         
         self.shape = shape #rows*columns, excluding negative coordinates, reserved for silences
-        self.grid = {}
+        self.masks = [] # Highlighted notes of each frame
+        self.others = {} # coord -> {frame: highlighted}, for silences and notes that are not highlighted
+        self.order = [] # Coordinates in the order they were first set
         self.frame_count = 0
         self.num_highlighted = None
+        self.is_shared = False # Shared skygrids are interned by a SkygridPool and cannot be modified
 
     def get_row_count(self):
         return self.shape[0]
@@ -20,10 +30,47 @@ class Skygrid():
     def get_shape(self):
         return self.shape
 
+    def get_bit_index(self, coord):
+        '''Returns the index of the bit of a note in the frame masks, or None if the note is outside of the grid'''
+        (row, col) = coord
+        if 0 <= row < self.shape[0] and 0 <= col < self.shape[1]:
+            return row * self.shape[1] + col
+        else:
+            return None
+
+    def get_frame_mask(self, frame):
+        '''Returns the bitmask of the notes highlighted in a frame'''
+        try:
+            return self.masks[frame] if frame >= 0 else 0
+        except IndexError:
+            return 0
+
     def set_note(self, coord, frame=None, highlighted=True):
+        '''Sets the note at coord in a frame, replacing the frames in which it was set before'''
+        if self.is_shared:
+            raise ValueError("Cannot set a note of a Skygrid shared by several instruments")
+        if frame is None: frame = max(1, self.get_frame_count()) - 1
+        
+        index = self.get_bit_index(coord)
+        if coord in self.others:
+            del self.others[coord]
+        elif index is not None and any(mask >> index & 1 for mask in self.masks):
+            bit = 1 << index
+            self.masks = [mask & ~bit for mask in self.masks]
+            while self.masks and not self.masks[-1]:
+                self.masks.pop()
+        else:
+            self.order.append(coord)
         
-        frames = [frame] if frame is not None else range(0,max(1,self.get_frame_count()))
-        for frame in frames: self.grid[coord] = {frame: highlighted}        
+        if highlighted and index is not None:
+            if len(self.masks) <= frame:
+                self.masks.extend([0] * (frame + 1 - len(self.masks)))
+            self.masks[frame] |= 1 << index
+        else:
+            self.others[coord] = {frame: highlighted}
+        
+        self.frame_count = 0
+        self.num_highlighted = None
 
     def get_grid(self, frame=None):
         """
@@ -37,61 +84,97 @@ class Skygrid():
         Full Example: {(0,0):{0:True}, (1,1):{0:True}}
         0 frame is the normal frame
         >1 frames are for notes of a triplet or quaver
+        The dictionary is built from the frame masks
         """
+        grid = {}
+        for coord in self.order:
+            try:
+                grid[coord] = self.others[coord]
+            except KeyError:
+                index = self.get_bit_index(coord)
+                grid[coord] = {f: True for (f, mask) in enumerate(self.masks) if mask >> index & 1}
+        
         if frame is None:
-            return self.grid
+            return grid
         else:
             if frame < 0 or frame > self.get_frame_count()-1:
                 return None
             else:
-                #return {coord:frames for coord,frames in self.grid.items() if frame in list(filter(lambda k:frames[k] is True, frames))}
-                return {coord:frames for coord,frames in self.grid.items() if frame in frames.keys()}
+                return {coord:frames for coord,frames in grid.items() if frame in frames.keys()}
 
     def get_num_highlighted(self):
         '''Returns the number of highlighted notes, whatever the frame'''
         if self.num_highlighted is None:
-            num = 0
-            for coord in self.grid.keys():
-                for frame in self.grid[coord].keys():
-                    if self.grid[coord][frame]:
-                        num += 1
+            num = sum(bin(mask).count('1') for mask in self.masks)
+            for frames in self.others.values():
+                num += sum(1 for highlighted in frames.values() if highlighted)
             self.num_highlighted = num
         
         return self.num_highlighted
 
     def get_frame_count(self):
         '''Returns the number of frames'''
-        if not self.frame_count:        
-            frame_counts = [max(list(self.grid[coord].keys()))+1 for coord in self.grid.keys()]
-            if frame_counts:
-                self.frame_count = max(frame_counts)
-            else:
-                self.frame_count = 0
+        if not self.frame_count:
+            frame_counts = [len(self.masks)] + [max(frames.keys())+1 for frames in self.others.values()]
+            self.frame_count = max(frame_counts)
             
         return self.frame_count 
   
     def get_highlighted_frames(self, note_coord):
         '''Returns a list of frame numbers in which the note at coord is highlighted'''
         try:
-            note_frames = self.grid[note_coord]  # Is note at 'position' highlighted or not
-            highlighted_frames = [frame_index for frame_index in note_frames.keys()]
-        except KeyError:  # Note is not in the grid dictionary: so it is not highlighted
-            highlighted_frames = []
-        return highlighted_frames
-
+            return list(self.others[note_coord].keys())
+        except KeyError:
+            pass
+        index = self.get_bit_index(note_coord)
+        if index is None:  # Note is not in the grid: so it is not highlighted
+            return []
+        return [frame for (frame, mask) in enumerate(self.masks) if mask >> index & 1]
 
     def get_highlighted_coords(self, frame=None):
         '''Returns a list of coordinates of highlighted notes, only in the specified frame'''   
-        #grid = instrument.get_grid(frame)
         highlighted_coords = []
         frames = [frame] if frame is not None else range(0,self.get_frame_count())
-        #grid = self.get_grid(frame)
-        if self.grid:
-            for frame in frames:
-                for coord in self.grid:  # Cycle over (row, col) positions in an icon
-                    highlighted = self.grid[coord].get(frame,False)  # Button is highlighted
-                    if highlighted: highlighted_coords += [coord]
+        for frame in frames:
+            mask = self.get_frame_mask(frame)
+            if not mask and not self.others:
+                continue
+            for coord in self.order:  # Cycle over (row, col) positions in the order they were set
+                index = self.get_bit_index(coord)
+                if index is not None and mask >> index & 1:
+                    highlighted_coords.append(coord)
+                elif coord in self.others and self.others[coord].get(frame, False):
+                    highlighted_coords.append(coord)
         return highlighted_coords
+
+    def get_render_key(self):
+        '''Returns a hashable summary of the notes, whatever the order in which they were set'''
+        others = tuple(sorted((coord, tuple(frames.items())) for (coord, frames) in self.others.items()))
+        return (self.shape, tuple(self.masks), others)
+
+    def get_intern_key(self):
+        '''Returns a hashable key identifying the skygrid, including the order in which notes were set'''
+        return self.get_render_key() + (tuple(self.order),)
+
+
+class SkygridPool(LRUCache):
+    """
+    Interns identical skygrids, so that all the instruments playing the same chord share one Skygrid object.
+    Songs repeat a small vocabulary of chords: the repeat, index, broken and silent states are kept by each instrument.
+    Interned skygrids are shared and cannot be modified.
+    """
+    def __init__(self):
+        super().__init__(max_size=None)
+
+    def intern(self, skygrid):
+        '''Returns the shared skygrid identical to skygrid, which becomes the shared one if it is new'''
+        key = skygrid.get_intern_key()
+        shared = self.get(key)
+        if shared is None:
+            skygrid.is_shared = True
+            self.put(key, skygrid)
+            return skygrid
+        return shared
         
         
 
@@ -100,6 +183,7 @@ HARPS = ['harp','drum']
 
 class Instrument():
 
+    __slots__ = ('repeat', 'index', 'is_silent', 'is_broken')
     type = 'GenericInstrument'
     def __init__(self):
         self.repeat = 1
@@ -144,8 +228,13 @@ class Instrument():
         '''Returns a boolean whether the harp is empty in this frame'''
         self.is_silent = is_silent
 
+    def get_render_key(self):
+        '''Returns a hashable summary of everything that changes the rendering of the instrument, except its index'''
+        return (self.type, self.repeat, self.is_silent, self.is_broken)
+
 
 class Voice(Instrument):  # Lyrics or comments
+    __slots__ = ('lyric', 'emphasis')
     type = 'voice'
     TAG_RE = re.compile(r'<[^>]+>')
     def __init__(self):
@@ -175,6 +264,9 @@ class Voice(Instrument):  # Lyrics or comments
             elif (len(star_match.group('start')) == 1 and len(star_match.group('end')) == 1):
                 self.emphasis = 'i'
 
+    def get_render_key(self):
+        return super().get_render_key() + (self.lyric, self.emphasis)
+
     def __len__(self):
         return len(self.lyric)
 
@@ -187,14 +279,43 @@ class Voice(Instrument):  # Lyrics or comments
 
 class Harp(Instrument):
     '''Any harmonic instrument with a 3x5 grid'''
+    __slots__ = ('skygrid',)
     type = 'harp'
     shape = (3, 5)
-    def __init__(self):
+    def __init__(self, skygrid=None):
+        '''skygrid is the grid of notes played, an empty one by default'''
         super().__init__()
-        self.skygrid = Skygrid(shape=self.shape)
-        
-    def __getattr__(self, attr_name):
-        return getattr(self.skygrid, attr_name)
+        if skygrid is None:
+            self.skygrid = Skygrid(shape=self.shape)
+        else:
+            self.set_skygrid(skygrid)
+
+    def get_row_count(self):
+        return self.skygrid.get_row_count()
+
+    def get_column_count(self):
+        return self.skygrid.get_column_count()
+
+    def get_shape(self):
+        return self.skygrid.get_shape()
+
+    def get_grid(self, frame=None):
+        return self.skygrid.get_grid(frame)
+
+    def get_num_highlighted(self):
+        return self.skygrid.get_num_highlighted()
+
+    def get_frame_count(self):
+        return self.skygrid.get_frame_count()
+
+    def get_frame_mask(self, frame):
+        return self.skygrid.get_frame_mask(frame)
+
+    def get_highlighted_frames(self, note_coord):
+        return self.skygrid.get_highlighted_frames(note_coord)
+
+    def get_highlighted_coords(self, frame=None):
+        return self.skygrid.get_highlighted_coords(frame)
 
     def get_is_dead(self):
         return self.get_is_broken() and self.get_num_highlighted() == 0
@@ -202,6 +323,9 @@ class Harp(Instrument):
     def get_aspect_ratio(self):
         return self.shape[1]/self.shape[0]
 
+    def get_render_key(self):
+        return super().get_render_key() + (self.shape, self.skygrid.get_render_key())
+
     def __len__(self):
         return self.shape[1] * self.shape[0]
 
@@ -216,10 +340,8 @@ class Harp(Instrument):
         return f'<{self.type}-{self.index}, {self.get_row_count()}*{self.get_column_count()}, {self.get_num_highlighted()} ON, repeat={self.repeat}, {broken}{silent}>'       
 
     def get_note_from_position(self, pos):
-        '''Returns the note type Root, Diamond, Circle from the position in Sky grid'''
-        # Calculate the note's overall index in the harp (0 to 14)              
-        
-        return notes.Note(self, pos)
+        '''Returns the note at a position in Sky grid, shared by all the instruments of the same shape'''
+        return notes.get_note(self.get_shape(), pos)
 
     def set_skygrid(self, skygrid):
         if self.shape != skygrid.shape:
@@ -227,9 +349,7 @@ class Harp(Instrument):
         self.skygrid = skygrid        
 
 class Drum(Harp):
+    __slots__ = ()
     type = 'drum'
     shape = (2,4)
-    def __init__(self):
-        super().__init__()
-        self.skygrid = Skygrid(shape=self.shape)
     
@@ -119,8 +119,8 @@ class InstrumentType(Enum):
     def get_long_desc(self, locale='en_US'):
         return Lang.get_string(self.long_desc_yaml, locale)
     
-    def get_instrument(self):
-        return self.instrument_class()
+    def get_instrument(self, **kwargs):
+        return self.instrument_class(**kwargs)
 
     def get_shape(self):
         return self.shape
@@ -147,6 +147,28 @@ class AspectRatio(Enum):
         return self.ratio
 
 
+class ImageFormat(Enum):
+    """Encodings of the pages drawn in RenderMode.PNG"""
+    PNG = ('png', 'PNG', 'image/png', '.png')  # Full RGBA PNG
+    PALETTE_PNG = ('palette_png', 'PNG', 'image/png', '.png')  # 8-bit palette PNG, lossy: the colours of the page are reduced to 256
+    WEBP = ('webp', 'WEBP', 'image/webp', '.webp')  # Lossless WebP
+
+    def __init__(self, short_name, pil_format, mime_type, extension):
+        self.short_name = short_name
+        self.pil_format = pil_format
+        self.mime_type = mime_type
+        self.extension = extension
+
+    def get_pil_format(self):
+        return self.pil_format
+
+    def get_mime_type(self):
+        return self.mime_type
+
+    def get_extension(self):
+        return self.extension
+
+
 class CSSMode(Enum):
     XML = 1
     HREF = XML
@@ -1,11 +1,17 @@
 
 class Note:
+    """
+    A position in the grid of an instrument.
+    Notes do not depend on the notes played by an instrument: the instrument is passed to the methods that need it,
+    and a single Note is shared by all the instruments of the same shape (see get_note).
+    """
+    __slots__ = ('position', 'shape', 'index')
 
-    def __init__(self, instrument, pos=None):
+    def __init__(self, shape, pos=None):
         self.position = pos
-        self.instrument = instrument #Instrument object owing the note
+        self.shape = shape
         if pos is not None:
-            self.index = (pos[0] * instrument.get_column_count()) + pos[1]
+            self.index = (pos[0] * shape[1]) + pos[1]
         else:
             self.index = None
 
@@ -13,32 +19,48 @@ class Note:
         """Return the note position as a tuple row/column"""
         return self.position
 
-    def set_position(self, pos):
-        """Sets the position tuple from row and column values"""
-        self.position = pos
-        self.index = (pos[0] * self.instrument.get_column_count()) + pos[1]
+    def get_shape(self):
+        """Returns the shape of the instrument grid"""
+        return self.shape
+
+    def get_row_count(self):
+        return self.shape[0]
+
+    def get_column_count(self):
+        return self.shape[1]
 
     def get_index(self):
         """Returns the note index in Sky grid"""
         return self.index
 
     def get_middle_position(self):
-        return (int(self.instrument.get_row_count()/2), int(self.instrument.get_column_count()/2))
+        return (int(self.shape[0]/2), int(self.shape[1]/2))
 
     def get_middle_index(self):
         """Returns the index at the center of Sky grid"""
-        return int(self.instrument.get_row_count() * self.instrument.get_column_count() / 2.0)
+        return int(self.shape[0] * self.shape[1] / 2.0)
 
-    def get_highlighted_frames(self):
-        return self.instrument.get_highlighted_frames(self.get_position())
+    def get_highlighted_frames(self, instrument):
+        return instrument.get_highlighted_frames(self.position)
 
-    def is_highlighted(self):
-        highlighted_frames = self.get_highlighted_frames()
+    def is_highlighted(self, instrument):
+        highlighted_frames = self.get_highlighted_frames(instrument)
         if len(highlighted_frames) > 0:
             return True
         else:
             return False
 
     def __str__(self):
-        return f"<{self.index}, pos={self.position}, highlighted frames={self.get_highlighted_frames()}>"
+        return f"<{self.index}, pos={self.position}, shape={self.shape}>"
+
+
+note_views = {} # (shape, position) -> Note
 
+def get_note(shape, pos):
+    """Returns the Note at a position of an instrument grid, created once per shape and position"""
+    try:
+        return note_views[(shape, pos)]
+    except KeyError:
+        note = Note(shape, pos)
+        note_views[(shape, pos)] = note
+        return note
@@ -1,5 +1,7 @@
 #import json, re
-import os
+import os, pickle
+import concurrent.futures
+from skymusic.cache import LRUCache
 from skymusic.resources import Resources
 from io import BytesIO
 from skymusic.parsers import music_theory
@@ -10,6 +12,21 @@ try:
 except (ImportError, ModuleNotFoundError):
     no_mido_module = True
 
+
+class MidiFileCache(LRUCache):
+    """
+    A least-recently-used cache of decoded MIDI files, keyed by their bytes.
+    A MIDI song is read several times before being rendered (key detection, note collection, parsing),
+    but it is decoded by mido and its tracks are scanned only once.
+    Cached files are shared and must not be modified.
+    """
+    def __init__(self, max_size=4):
+        super().__init__(max_size)
+
+
+midi_files = MidiFileCache()
+
+
 class MidiSongParser:
     """
     For parsing a text format into a Song object
@@ -50,41 +67,46 @@ class MidiSongParser:
         except AttributeError: #Neither string or bytes, skipping
             return False
     
-    def extract_note_interval(self, track, min_interval):
+    def scan_track(self, track):
+        """
+        Reads all the messages of a track once, and returns a dict with everything the parser needs:
+        the track name, musical key and copyright, whether it has notes, the lowest note,
+        the times of the first notes (for tempo analysis) and the note_on messages with their absolute times
+        """
+        scan = {'name': None, 'key': None, 'copyright': '', 'has_notes': False, 'lowest_note': 128, 'note_times': [], 'note_msgs': []}
         
-        times = []
         t = 0
-        '''
-        for i, msg in enumerate(track):
-            try:
-                t += msg.time
-            except AttributeError:
-                pass
-            if msg.type == 'note_on':
-                t2 = 0
-                for msg2 in track[i:]:
-                    try:
-                        t2 += msg2.time
-                    except AttributeError:
-                        pass
-                    if msg2.type == 'note_off':
-                        if msg2.note == msg.note:
-                            times.append(t+t2)
-                            break
-        '''
-        i = 0
         for msg in track:
-            if i > 128:
-                break
-            if msg.type == 'note_on':
-                if msg.velocity != 0: #reject  silences
-                    times.append(t)
-                    i += 1
+            msg_t = t
             try:
                 t += msg.time
             except AttributeError:
                 pass
-                
+            if msg.type == 'note_on':
+                if msg.note < scan['lowest_note']:
+                    scan['lowest_note'] = msg.note
+                if msg.velocity != 0 and len(scan['note_times']) <= 128: #reject  silences
+                    scan['note_times'].append(msg_t)
+                scan['note_msgs'].append((t, msg))
+            elif msg.type == 'key_signature':
+                if scan['key'] is None:
+                    scan['key'] = msg.key
+            elif msg.type == 'track_name':
+                if scan['name'] is None:
+                    scan['name'] = msg.name
+            elif msg.type == 'copyright':
+                scan['copyright'] = msg.text
+            if not msg.is_meta:
+                scan['has_notes'] = True
+        
+        if scan['name'] is None:
+            scan['name'] = ''
+        
+        return scan
+
+    def extract_note_interval(self, track_scan, min_interval):
+        
+        times = track_scan['note_times']
         if len(times) == 0:
             return None
         
@@ -97,65 +119,54 @@ class MidiSongParser:
             
         return note_interval
     
-    def has_notes(self, track):
+    def has_notes(self, track_scan):
         
-        return any([not msg.is_meta for msg in track])
+        return track_scan['has_notes']
 
-    def extract_key(self, track):
-        
-        for msg in track:
-            if msg.type == 'key_signature':
-                return msg.key
+    def extract_key(self, track_scan):
         
-        return None
+        return track_scan['key']
  
-    def extract_first_key(self, midi_file):
+    def extract_first_key(self, track_scans):
         
-        if midi_file:
-            for track in midi_file.tracks:
-                track_key = self.extract_key(track)
+        if track_scans:
+            for track_scan in track_scans:
+                track_key = self.extract_key(track_scan)
                 if track_key:
                     return track_key
         
         return None
 
-    def extract_copyright(self, midi_file):
+    def extract_copyright(self, track_scans):
         
         copyright = ''
-        if midi_file.tracks:
-            for msg in midi_file.tracks[0]:
-                if msg.type == 'copyright':
-                    copyright = msg.text
+        if track_scans:
+            copyright = track_scans[0]['copyright']
                     
         return copyright
                                          
                                                             
-    def extract_lowest_octave(self, track):
+    def extract_lowest_octave(self, track_scan):
         
-        lowest = 128
-        for msg in track:
-            if msg.type == 'note_on':
-                if msg.note < lowest:
-                    lowest = msg.note
-                    
+        lowest = track_scan['lowest_note']
         lowest_octave = int((lowest - self.root_pitch) / 12)
         
         return lowest_octave
 
-    def parse_track_info(self, track):
+    def parse_track_info(self, track_scan):
         
         track_info = ""
-        if track.name:
-            track_info += '## Track name: ' + track.name
+        if track_scan['name']:
+            track_info += '## Track name: ' + track_scan['name']
         
-        if self.has_notes(track):
-            track_key = self.extract_key(track)
+        if self.has_notes(track_scan):
+            track_key = self.extract_key(track_scan)
             if track_key:
                 track_info += ', musical key= ' + track_key
         
         return track_info
     
-    def parse_first_meta(self, midi_file):
+    def parse_first_meta(self, midi_file, track_scans):
         
         metadata = []
         #TODO : extract copyright
@@ -164,11 +175,11 @@ class MidiSongParser:
             (basename,_) = os.path.splitext(midi_file.filename)
         metadata.append(Resources.DELIMITERS['metadata'] + 'Title:' + basename.capitalize())
         
-        artist = self.extract_copyright(midi_file)
+        artist = self.extract_copyright(track_scans)
         metadata.append(Resources.DELIMITERS['metadata'] + 'Artist: ' + artist)
         metadata.append(Resources.DELIMITERS['metadata'] + 'Transcript writer:' + '')
         
-        first_key = self.extract_first_key(midi_file)
+        first_key = self.extract_first_key(track_scans)
         
         if first_key:
             metadata.append(Resources.DELIMITERS['metadata'] + 'Musical key: ' + first_key)
@@ -194,49 +205,43 @@ class MidiSongParser:
             
         return note + str(octave-base_octave+Resources.PARSING_START_OCTAVE)
     
-    def parse_notes(self, track, note_interval):
+    def parse_notes(self, track_scan, note_interval):
         
-        base_octave = self.extract_lowest_octave(track)
+        base_octave = self.extract_lowest_octave(track_scan)
         
         notes = ['']
-        t = 0
         prev_t = -note_interval
         prev_prev_t = prev_t
-        for msg in track:
-            try:
-                t += msg.time
-            except AttributeError:
-                pass
-            if msg.type == 'note_on':
-                
-                dt = t - prev_t
-                
-                notes += [Resources.DELIMITERS['pause']]*int(dt/note_interval - 1) #parses implicit silences
-                
-                note = self.parse_note_msg(msg, base_octave)
+        for (t, msg) in track_scan['note_msgs']:
+            
+            dt = t - prev_t
+            
+            notes += [Resources.DELIMITERS['pause']]*int(dt/note_interval - 1) #parses implicit silences
+            
+            note = self.parse_note_msg(msg, base_octave)
+            
+            if note == Resources.DELIMITERS['pause']:
+                if dt > 0.5*note_interval:
+                    notes.append(note)
+                  
+            elif note:
                 
-                if note == Resources.DELIMITERS['pause']:
-                    if dt > 0.5*note_interval:
-                        notes.append(note)
-                      
-                elif note:
-                    
-                    if notes[-1] == Resources.DELIMITERS['pause']:
-                        if (t - prev_prev_t < note_interval):
-                            del(notes[-1])
-                        notes.append(note)
+                if notes[-1] == Resources.DELIMITERS['pause']:
+                    if (t - prev_prev_t < note_interval):
+                        del(notes[-1])
+                    notes.append(note)
+                else:
+                    if dt == 0: #chord
+                        notes[-1] += note
+                    elif (dt <= 0.45*note_interval) and (notes[-1] != Resources.DELIMITERS['pause']):
+                        notes[-1] += Resources.DELIMITERS['quaver'] + note
                     else:
-                        if dt == 0: #chord
-                            notes[-1] += note
-                        elif (dt <= 0.45*note_interval) and (notes[-1] != Resources.DELIMITERS['pause']):
-                            notes[-1] += Resources.DELIMITERS['quaver'] + note
-                        else:
-                            notes.append(note)
+                        notes.append(note)
+              
+            if note:
+                prev_prev_t = prev_t
+                prev_t = t
                   
-                if note:
-                    prev_prev_t = prev_t
-                    prev_t = t
-                      
         return self.icon_delimiter.join(filter(None,notes))
 
     def sanitize_midi_lines(self, midi_lines):
@@ -248,71 +253,131 @@ class MidiSongParser:
 
         return midi_bytes                                                      
 
-    def create_MidiFile(self, midi_lines):
-        
+    def read_midi(self, midi_lines):
+        """
+        Decodes the MIDI file and scans its tracks, or returns them from the cache if this file was read before.
+        Returns a (midi_file, track_scans) tuple, or None if the file could not be decoded
+        """
         if no_mido_module:
             print("\n***ERROR: MIDI could not be imported because mido module was not found.")
             return None
         
         midi_bytes = self.sanitize_midi_lines(midi_lines)
         
-        buffer = BytesIO()
-        buffer.write(midi_bytes)
-        buffer.seek(0)
+        midi = midi_files.get(midi_bytes)
+        if midi is None:
+            buffer = BytesIO()
+            buffer.write(midi_bytes)
+            buffer.seek(0)
+            
+            try:
+                mid = mido.MidiFile(file=buffer)
+            except (IOError, EOFError):
+                print("\n***ERROR: mido could not detect your file as being midi.")
+                return None
+            
+            midi = (mid, [self.scan_track(track) for track in mid.tracks])
+            midi_files.put(midi_bytes, midi)
+        
+        return midi
+
+    def create_MidiFile(self, midi_lines):
         
-        try:
-            mid = mido.MidiFile(file=buffer)
-        except (IOError, EOFError):
-            print("\n***ERROR: mido could not detect your file as being midi.")
-            return None
+        midi = self.read_midi(midi_lines)
         
-        return mid 
+        return midi[0] if midi else None
 
     def find_key(self, midi_lines):
         
-        mid = self.create_MidiFile(midi_lines)
-        song_key = self.extract_first_key(mid)
+        midi = self.read_midi(midi_lines)
+        song_key = self.extract_first_key(midi[1]) if midi else None
         
         return [song_key] if song_key else []
-                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                               
     
     def collect_notes(self, midi_lines):
         '''Only used by Music Theory'''
-        mid = self.create_MidiFile(midi_lines)
+        midi = self.read_midi(midi_lines)
         
-        if mid:
+        if midi:
             song = []
-            for track in mid.tracks:
-                for msg in track:
-                    if msg.type == 'note_on':
-                        note = self.parse_note_msg(msg, 1)
-                        if note:
-                            song.append(note)
+            for track_scan in midi[1]:
+                for (_, msg) in track_scan['note_msgs']:
+                    note = self.parse_note_msg(msg, 1)
+                    if note:
+                        song.append(note)
             
             return [self.icon_delimiter.join(song)]
-                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                  
-    def parse_midi(self, midi_lines):
+    
+    def convert_track(self, track_scan):
+        """Returns the track info and the notes of a track, as song lines"""
+        track_info = self.parse_track_info(track_scan)
+        
+        note_interval = self.extract_note_interval(track_scan, 1)
         
+        if note_interval is not None:          
+            notes = self.parse_notes(track_scan, note_interval)
+        else:
+            notes = ''
+        
+        return (track_info, notes)
+
+    def iter_tracks_in_pool(self, track_scans, num_workers):
+        """
+        Converts the tracks concurrently in worker processes, and yields their (track_info, notes) in the original order
+        """
+        num_done = 0
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(num_workers, len(track_scans)),
+                                                        initializer=_init_midi_worker,
+                                                        initargs=(self,)) as executor:
+                for converted_track in executor.map(_convert_track_in_worker, track_scans):
+                    yield converted_track
+                    num_done += 1
+        except (OSError, RuntimeError, pickle.PicklingError) as err:
+            print(f"\n***WARNING: Could not convert the MIDI tracks in parallel ({err}). Converting them one by one.")
+        
+        for track_scan in track_scans[num_done:]:
+            yield self.convert_track(track_scan)
+
+    def __getstate__(self):
+        """The maker is not sent to the worker processes converting tracks in parallel"""
+        state = self.__dict__.copy()
+        state['maker'] = None
+        return state
+    
+    def parse_midi(self, midi_lines, num_workers=None):
+        """
+        Converts a MIDI file into song lines, with one layer per track.
+        With num_workers > 1, the tracks are converted concurrently by that many processes.
+        """
         if no_mido_module: return []
-        mid = self.create_MidiFile(midi_lines)
-        if not mid: return []
-        song = self.parse_first_meta(mid)
+        midi = self.read_midi(midi_lines)
+        if not midi: return []
+        (mid, track_scans) = midi
+        song = self.parse_first_meta(mid, track_scans)
         
-        for i, track in enumerate(mid.tracks):
-            
-            track_info = self.parse_track_info(track)
-            
-            note_interval = self.extract_note_interval(track, 1)
-            
-            if note_interval is not None:          
-                notes = self.parse_notes(track, note_interval)
-            else:
-                notes = ''
+        if num_workers is None: num_workers = Resources.midi_num_workers
+        
+        if num_workers > 1 and len(track_scans) > 1:
+            converted_tracks = self.iter_tracks_in_pool(track_scans, num_workers)
+        else:
+            converted_tracks = (self.convert_track(track_scan) for track_scan in track_scans)
+        
+        for (track_info, notes) in converted_tracks:
             
-            if (track_info and not notes) and len(mid.tracks) > 2:
+            if (track_info and not notes) and len(track_scans) > 2:
                 song += [self.layer_delimiter]
                 
             song += [track_info] + [notes]
             
         song = list(filter(None,song))
         return song
+
+
+def _init_midi_worker(midi_song_parser):
+    global _worker_parser
+    
+    _worker_parser = midi_song_parser
+
+def _convert_track_in_worker(track_scan):
+    return _worker_parser.convert_track(track_scan)
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 import os, re
 from operator import truediv, itemgetter
-from collections import OrderedDict
+from collections import OrderedDict, Counter
 from skymusic.modes import InputMode
 from skymusic.parsers.html_parser import HtmlSongParser
+from skymusic.resources import Resources
+try:
+    import numpy
+    no_numpy_module = False
+except (ImportError, ModuleNotFoundError):
+    no_numpy_module = True
 
 class MusicTheory():
     """
@@ -12,6 +18,10 @@ class MusicTheory():
         
     """
     
+    DEFG_REGEX = re.compile('[D-Gd-g]')
+    QWRT_REGEX = re.compile('[QWRTSZXVqwrtszxv]')
+    OCTAVE_REGEX = re.compile(r'\d')
+    
     def __init__(self, song_parser):
         
         self.song_parser = song_parser # Vital, essential! 
@@ -21,6 +31,8 @@ class MusicTheory():
         """
         Attempts to detect input musical notation for the textual song in 'song_lines'.
         Returns a list with the probable input modes (eliminating the least likely)
+        Each chord is tokenised once and scored against all notations at the same time.
+        Detection stops early once the ranking has stopped changing over a sampled part of the song.
         """
         from skymusic.parsers import json_parser, midi_parser
         
@@ -44,53 +56,85 @@ class MusicTheory():
 
         possible_modes = [mode for mode in InputMode if mode not in [InputMode.SKYJSON, InputMode.SKYHTML, InputMode.MIDI]]
         possible_parsers = [song_parser.get_note_parser(mode) for mode in possible_modes]
-        possible_regex = [parser.single_note_name_regex for parser in possible_parsers]
-
-        good_notes = [0] * len(possible_modes)
-        num_notes = [0] * len(possible_modes)
-        defg_notes = 0
-        qwrt_notes = 0
-        octave_span = 0
+        english_idx = possible_modes.index(InputMode.ENGLISH)
+        
+        # Parsers sharing the same note name regex split chords identically: they are split once per group
+        chord_parsers = [] # (idx, chords dict) of parsers recognizing abbreviated chord names
+        note_groups = OrderedDict() # regex key -> (parser, [(idx, single note regex),...])
+        for idx, parser in enumerate(possible_parsers):
+            if 'chords' in parser.__dict__.keys():
+                chord_parsers.append((idx, parser.chords))
+            else:
+                regex = parser.note_name_regex
+                note_groups.setdefault((regex.pattern, regex.flags), (parser, []))[1].append((idx, parser.single_note_name_regex))
+
+        pause = song_parser.pause
+        stats = {'good_notes': [0] * len(possible_modes), 'num_notes': [0] * len(possible_modes),
+                 'defg_notes': 0, 'qwrt_notes': 0, 'octave_span': 0}
+        good_notes = stats['good_notes']
+        num_notes = stats['num_notes']
+        
+        num_chords = 0
+        next_check = Resources.DETECT_MODE_SAMPLE
+        ranking = None
 
         for line in song_lines:
             line = song_parser.sanitize_line(line)
-            if len(line) > 0:
-                if line[0] != song_parser.lyric_delimiter:
-                    icons = song_parser.split_line(line)
-                    for icon in icons:
-                        chords = song_parser.split_icon(icon)
-                        for chord in chords:
-                            for idx, possible_mode in enumerate(possible_modes):
-
-                                if 'chords' in possible_parsers[idx].__dict__.keys():
-                                    notes = [chord]  # Because abbreviated chord names are not composed of note names
-                                    good_notes[idx] += sum(
-                                        [int(note in possible_parsers[idx].chords.keys()) for note in notes])
-                                else:
-                                    _, chord = song_parser.split_repeat(chord)
-                                    notes = song_parser.split_chord(chord, possible_parsers[idx])
-                                    good_notes[idx] += sum(
-                                        [int(possible_regex[idx].match(note) is not None) for note in notes if
-                                         note != song_parser.pause])
-                                # TODO: use self.map_note_to_position?
-
-                                num_notes[idx] += sum([1 for note in notes if note != song_parser.pause])
-
-                                if possible_mode == InputMode.ENGLISH:
-                                    defg_notes += sum([int(re.search('[D-Gd-g]', note) is not None) for note in notes])
-                                    qwrt_notes += sum(
-                                        [int(re.search('[QWRTSZXVqwrtszxv]', note) is not None) for note in notes])
-                                    octaves = [re.search('\d', note) for note in notes]
-
-                                    octaves = sorted([int(octave.group(0)) for octave in octaves if octave is not None])
-                                    if len(octaves) > 0:
-                                        octave_span = max(octave_span, octaves[-1] - octaves[0] + 1)
-
-        num_notes = [1 if x == 0 else x for x in num_notes]  # Removes zeros to avoid division by zero
-
-        scores = list(map(truediv, good_notes, num_notes))
-        defg_notes /= num_notes[possible_modes.index(InputMode.ENGLISH)]
-        qwrt_notes /= num_notes[possible_modes.index(InputMode.SKYKEYBOARD)]
+            if len(line) == 0 or line[0] == song_parser.lyric_delimiter:
+                continue
+            for icon in song_parser.split_line(line):
+                for chord in song_parser.split_icon(icon):
+                    num_chords += 1
+                    _, bare_chord = song_parser.split_repeat(chord)
+                    
+                    for (idx, chords) in chord_parsers:
+                        # Because abbreviated chord names are not composed of note names
+                        good_notes[idx] += int(bare_chord in chords)
+                        num_notes[idx] += int(bare_chord != pause)
+                    
+                    for (parser, members) in note_groups.values():
+                        notes = [note for note in song_parser.split_chord(bare_chord, parser) if note != pause]
+                        for (idx, single_note_regex) in members:
+                            good_notes[idx] += sum([1 for note in notes if single_note_regex.match(note) is not None])
+                            num_notes[idx] += len(notes)
+                            if idx == english_idx:
+                                self.__count_english_hints__(notes, stats)
+
+            if num_chords >= next_check:
+                # Stops when the ranking is the same as at the previous check
+                new_ranking = self.__rank_input_modes__(stats, possible_modes)
+                if new_ranking == ranking:
+                    return new_ranking
+                ranking = new_ranking
+                next_check = num_chords + Resources.DETECT_MODE_SAMPLE
+
+        return self.__rank_input_modes__(stats, possible_modes)
+
+    
+    def __count_english_hints__(self, notes, stats):
+        """
+        Counts the notes that are specific to the English notation (D, E, F, G) or the keyboard notation (Q, W, R, T...),
+        and the octave span of the chord, in the English reading of the chord notes
+        """
+        stats['defg_notes'] += sum([1 for note in notes if self.DEFG_REGEX.search(note) is not None])
+        stats['qwrt_notes'] += sum([1 for note in notes if self.QWRT_REGEX.search(note) is not None])
+        octaves = [self.OCTAVE_REGEX.search(note) for note in notes]
+        
+        octaves = sorted([int(octave.group(0)) for octave in octaves if octave is not None])
+        if len(octaves) > 0:
+            stats['octave_span'] = max(stats['octave_span'], octaves[-1] - octaves[0] + 1)
+    
+
+    def __rank_input_modes__(self, stats, possible_modes):
+        """
+        Turns the note counts collected by detect_input_mode into a list of probable input modes
+        """
+        num_notes = [1 if x == 0 else x for x in stats['num_notes']]  # Removes zeros to avoid division by zero
+
+        scores = list(map(truediv, stats['good_notes'], num_notes))
+        defg_notes = stats['defg_notes'] / num_notes[possible_modes.index(InputMode.ENGLISH)]
+        qwrt_notes = stats['qwrt_notes'] / num_notes[possible_modes.index(InputMode.SKYKEYBOARD)]
+        octave_span = stats['octave_span']
 
         if ((defg_notes == 0) or (defg_notes < 0.01 and octave_span > 2)) and (
                 num_notes[possible_modes.index(InputMode.ENGLISH)] > 10):
@@ -141,28 +185,21 @@ class MusicTheory():
         inv_dict = OrderedDict({v: k for k, v in reversed(OrderedDict(chromatic_dict).items())})
         possible_keys = list(reversed(inv_dict.values()))
         
-        scores = [0] * len(possible_keys)
-        num_notes = [0] * len(possible_keys)
+        # A single pass over the song to count each note, then each key is scored against the pitch histogram
+        note_counts = Counter()
         for line in song_lines:
             if len(line) > 0:
                 if line[0] != song_parser.lyric_delimiter:
                     notes = is_note_regex.sub(' \\1',
                                               not_note_regex.sub('', line)).split()  # Clean-up, adds space and split
-                    for i, k in enumerate(possible_keys):
-                        for note in notes:
-                            num_notes[i] += 1
-                            try:
-                                # TODO: Support for Jianpu which uses a different octave indexing system
-                                note_parser.calculate_coordinate_for_note(note, k, note_shift=0,
-                                                                               is_finding_key=True)
-                            except KeyError:
-                                scores[i] += 1
-                            except SyntaxError:  # Wrongly formatted notes are ignored
-                                num_notes[i] -= 1
-
-        num_notes = [1 if x == 0 else x for x in num_notes]
-        # Removes zeros to avoid division by zero
-        scores = list(map(truediv, scores, num_notes))
+                    note_counts.update(notes)
+
+        # TODO: Support for Jianpu which uses a different octave indexing system
+        histogram = note_parser.get_pitch_histogram(note_counts)
+        num_notes = sum(histogram.values())
+        num_notes = 1 if num_notes == 0 else num_notes  # Removes zeros to avoid division by zero
+        
+        scores = [note_parser.count_notes_out_of_key(histogram, k) / num_notes for k in possible_keys]
         scores = [(1 - score) for score in scores]
 
         return self.most_likely(scores, possible_keys, 0.9)
@@ -203,6 +240,10 @@ class MusicTheory():
     
     
     def spectrum(self, x, y):
+        """
+        Returns the frequencies and the power spectrum of y(x), zero-padded to a power of 2 length
+        Uses numpy.fft if NumPy is installed, or a pure-Python FFT otherwise
+        """
         import cmath
         from math import log, ceil
         
@@ -224,11 +265,15 @@ class MusicTheory():
 
         n1 = len(y)
         m = ceil(log(n1)/log(2))
-        ffty = fft(y + [0]*(2**m - n1)) #Zero padding to a power of 2 length  
-        n2 = len(ffty)
+        n2 = 2**m #Zero padding to a power of 2 length
         dx = x[2] - x[1]
         f = [k/(dx*n2) for k in range(int(n2/2))]
-        sp = [abs(ffty[k])**2 for k in range(int(n2/2))]
+        if not no_numpy_module:
+            ffty = numpy.fft.rfft(numpy.asarray(y, dtype=float), n2)[:int(n2/2)]
+            sp = (numpy.abs(ffty)**2).tolist()
+        else:
+            ffty = fft(y + [0]*(n2 - n1))
+            sp = [abs(ffty[k])**2 for k in range(int(n2/2))]
         return f, sp
 
 
@@ -253,7 +298,10 @@ class MusicTheory():
                 z_band = z[i1:i2+1]
                 t_band = t[i1:i2+1]
                 iG_old = iG
-                tG = sum([z*t for (t,z) in zip(t_band, z_band)])/(max(1,sum(z_band)))
+                if not no_numpy_module:
+                    tG = float(numpy.dot(z_band, t_band))/(max(1,float(z_band.sum())))
+                else:
+                    tG = sum([z*t for (t,z) in zip(t_band, z_band)])/(max(1,sum(z_band)))
                 iG = round((tG - tmin)/dt)
                 n += 1        
             return (i1, i2), tG 
@@ -291,12 +339,18 @@ class MusicTheory():
         plt.show()
         """
         
-        absolute_max = max(y2)
+        if not no_numpy_module:
+            x2 = numpy.asarray(x2, dtype=float)
+            y2 = numpy.asarray(y2, dtype=float)
+            find_max = lambda y: (y.max(), int(y.argmax()))
+        else:
+            find_max = lambda y: (max(y), y.index(max(y)))
+        
+        (absolute_max, _) = find_max(y2)
         for i in range(max_peaks):
-            y0 = max(y2)
+            (y0, i0) = find_max(y2)
             if (y0 < absolute_max*threshold) or (y0==0):
                 break
-            i0 = y2.index(y0)
             (i1, i2), tG = find_barycenter(x2, y2, i0, div_resol)
             peaks.append((tG, y0))
             y2[i1:i2+1] = [0]*len(y2[i1:i2+1])#peak deletion 
@@ -304,16 +358,21 @@ class MusicTheory():
         return [delay for (delay, occ) in peaks]
 
     
+    def build_histogram(self, vals, hbin):
+        """Returns the bins and the number of occurrences of vals in each bin of width hbin, starting at 0"""
+        num_slots = 2 + int(max(vals) / hbin)
+        t = [i*hbin for i in range(num_slots)] #delays
+        if not no_numpy_module:
+            h = numpy.zeros(num_slots, dtype=int) #occurrences
+            numpy.add.at(h, 1 + numpy.trunc(numpy.asarray(vals) / hbin).astype(int), 1)
+            return (t, h.tolist())
+        h = [0]*num_slots #occurrences
+        for v in vals: #histogram starting at t=0
+            h[1+int(v/hbin)] += 1
+        return (t, h)
+
     def analyze_tempo(self, times, chord_delay, method='diff'):
         
-        def build_histogram(vals, hbin):
-            num_slots = 2 + int(max(vals) / hbin)
-            h = [0]*num_slots #occurrences
-            t = [i*hbin for i in range(num_slots)] #delays
-            for v in vals: #histogram starting at t=0
-                h[1+int(v/hbin)] += 1
-            return (t, h)
-        
         if len(times) <= 1:
             return []
         
@@ -323,7 +382,7 @@ class MusicTheory():
         
         # Typical spacing between two consecutive notes
         dtimes = [times[i] - times[i-1] for i in range(1, len(times))]
-        (dt, dh) = build_histogram(dtimes, tbin)
+        (dt, dh) = self.build_histogram(dtimes, tbin)
         
         
         typ_diffs = self.find_peaks(dt, dh, 1/10, 3)
@@ -333,7 +392,7 @@ class MusicTheory():
             return typ_diffs
 
         # Notes strokes versus time
-        (t, h) = build_histogram(times[:128], tbin)
+        (t, h) = self.build_histogram(times[:128], tbin)
         f, sp = self.spectrum(t, h)
         f0 = f[1]/2
         taus = [1/(max(x,f0)) for x in f]
@@ -63,4 +63,11 @@ class EnglishChords(english.English):
     def calculate_coordinate_for_note(self, note, song_key='C', note_shift=0, is_finding_key=False):
 
         return self.helper_parser.calculate_coordinate_for_note(note, song_key, note_shift, is_finding_key)
-        
+
+    def get_pitch_histogram(self, note_counts):
+
+        return self.helper_parser.get_pitch_histogram(note_counts)
+
+    def count_notes_out_of_key(self, histogram, song_key):
+
+        return self.helper_parser.count_notes_out_of_key(histogram, song_key)
@@ -37,6 +37,9 @@ class NoteParser:
         #Octave-less notes will be assigned to this octave, e.g. F == F1
         self.default_starting_octave = start_octave
 
+        # Coordinates of the notes already parsed, per song key, note shift and shape
+        self.coordinate_tables = {}
+
     def get_column_count(self): return self.shape[1]
 
     def get_row_count(self): return self.shape[0]
@@ -176,15 +179,23 @@ class NoteParser:
         Handle notes specified without octaves (e.g. the note G in the key of Ab)
         """
 
-        note_octave = self.get_default_starting_octave()
+        note_octave = self.get_octave_of_note_without_octave(self.convert_note_name_into_chromatic_position(note_name),
+                                                             self.convert_note_name_into_chromatic_position(song_key))
+
+        return note_name, note_octave
 
-        chromatic_interval = self.convert_note_name_into_chromatic_position(
-            note_name) - self.convert_note_name_into_chromatic_position(song_key)
+    def get_octave_of_note_without_octave(self, chromatic_position, song_key_chromatic_position):
 
-        if chromatic_interval < 0:
+        """
+        Returns the octave of a note written without octave when finding the key: the octave starting with the song key
+        """
+
+        note_octave = self.get_default_starting_octave()
+
+        if chromatic_position - song_key_chromatic_position < 0:
             note_octave += 1
 
-        return note_name, note_octave
+        return note_octave
 
     def convert_note_name_into_chromatic_position(self, note_name):
 
@@ -224,8 +235,45 @@ class NoteParser:
         else:
             raise KeyError(f"ParsingError: Interval {semitone_interval} is not in the major scale.")
 
+    def get_coordinate_table(self, song_key, note_shift=0, is_finding_key=False):
+
+        """
+        Returns the table of note coordinates for a song key, note shift and instrument shape.
+        The table maps each note already parsed to its coordinate, or to the (exception class, arguments) raised for a broken note
+        """
+        table_key = (song_key, note_shift, is_finding_key, self.shape)
+        try:
+            return self.coordinate_tables[table_key]
+        except KeyError:
+            table = {}
+            self.coordinate_tables[table_key] = table
+            return table
+
     def calculate_coordinate_for_note(self, note, song_key=Resources.DEFAULT_KEY, note_shift=0, is_finding_key=False):
 
+        """
+        Returns the coordinate of a note on the Sky piano, looking it up in the table of the song key and note shift.
+        Notes that are not in the table yet are computed once by compute_coordinate_for_note.
+        Raises the same KeyError or SyntaxError as compute_coordinate_for_note for broken notes.
+        """
+        table = self.get_coordinate_table(song_key, note_shift, is_finding_key)
+        try:
+            coordinate = table[note]
+        except KeyError:
+            try:
+                coordinate = self.compute_coordinate_for_note(note, song_key, note_shift, is_finding_key)
+            except (KeyError, SyntaxError) as err:
+                coordinate = (err.__class__, err.args)
+            table[note] = coordinate
+        
+        if isinstance(coordinate[0], type):
+            (error_class, error_args) = coordinate
+            raise error_class(*error_args)
+        
+        return coordinate
+
+    def compute_coordinate_for_note(self, note, song_key=Resources.DEFAULT_KEY, note_shift=0, is_finding_key=False):
+
         """
 
         For a note in the format self.note_name_with_octave_regex, this method returns the corresponding coordinate
@@ -250,13 +298,7 @@ class NoteParser:
 
         # Find the major scale interval from the song_key to the note_name
         # Find the semitone interval from the song_key to the note_name first
-        if song_key is None:
-            song_key = Resources.DEFAULT_KEY
-        try:
-            song_key_chromatic_equivalent = self.convert_note_name_into_chromatic_position(song_key)
-        except (KeyError, SyntaxError):
-            # default to C major
-            song_key_chromatic_equivalent = 0
+        song_key_chromatic_equivalent = self.get_song_key_chromatic_position(song_key)
         try:
             note_name_chromatic_equivalent = self.convert_note_name_into_chromatic_position(note_name)
         except KeyError:
@@ -265,7 +307,42 @@ class NoteParser:
         except SyntaxError:
             raise SyntaxError(f"Note {note_name} was not formatted correctly.")
 
-        interval_in_semitones = note_name_chromatic_equivalent - song_key_chromatic_equivalent
+        try:
+            note_coordinate = self.compute_coordinate_for_pitch(note_name_chromatic_equivalent, note_octave, song_key_chromatic_equivalent, note_shift)
+        except KeyError:
+            # Turn note into a broken harp, since note is not in the song_key
+            raise KeyError(f"Note {note} is not in the song key.")
+
+        if self.is_coordinate_in_range(note_coordinate):
+            return note_coordinate
+        else:
+            # Coordinate is not in range of the two octaves of the Sky piano
+            raise KeyError(f"Note {note} is not in range of the two octaves of the Sky piano: {note_coordinate}")
+            # TODO: define custom errors
+
+    def get_song_key_chromatic_position(self, song_key):
+
+        """
+        Returns the position of song_key in the chromatic scale, defaulting to C major for unknown keys
+        """
+
+        if song_key is None:
+            song_key = Resources.DEFAULT_KEY
+        try:
+            return self.convert_note_name_into_chromatic_position(song_key)
+        except (KeyError, SyntaxError):
+            # default to C major
+            return 0
+
+    def compute_coordinate_for_pitch(self, chromatic_position, note_octave, song_key_chromatic_position, note_shift=0):
+
+        """
+        Returns the coordinate of a note given by its chromatic position and octave, which may be out of the range of the instrument.
+        This is the arithmetic shared by compute_coordinate_for_note and count_notes_out_of_key.
+        Raises KeyError if the note is not in the major scale of the song key
+        """
+
+        interval_in_semitones = chromatic_position - song_key_chromatic_position
         if interval_in_semitones < 0:
             # Circular shift the interval back to a positive number
             interval_in_semitones += self.get_chromatic_scale_count()
@@ -273,11 +350,7 @@ class NoteParser:
 
         note_octave_str = self.convert_base_10_to_base_7(note_octave)
 
-        try:
-            major_scale_interval = self.convert_semitone_interval_to_major_scale_interval(interval_in_semitones)
-        except KeyError:
-            # Turn note into a broken harp, since note is not in the song_key
-            raise KeyError(f"Note {note} is not in the song key.")
+        major_scale_interval = self.convert_semitone_interval_to_major_scale_interval(interval_in_semitones)
 
         # Convert note to base 10 for arithmetic
         note_in_base_10 = self.convert_base_7_to_base_10(note_octave_str + str(major_scale_interval))
@@ -287,14 +360,68 @@ class NoteParser:
         # Apply the note shift whether the octave has been explicitely written or not
         note_in_base_10 += note_shift
 
-        note_coordinate = self.convert_base_10_to_coordinate_of_another_base(note_in_base_10, self.get_column_count())
+        return self.convert_base_10_to_coordinate_of_another_base(note_in_base_10, self.get_column_count())
 
-        if self.is_coordinate_in_range(note_coordinate):
-            return note_coordinate
-        else:
-            # Coordinate is not in range of the two octaves of the Sky piano
-            raise KeyError(f"Note {note} is not in range of the two octaves of the Sky piano: {note_coordinate}")
-            # TODO: define custom errors
+    def get_pitch_histogram(self, note_counts):
+
+        """
+        Sorts the notes of a song by chromatic position and octave, to find the song key.
+        note_counts maps each note to its number of occurrences in the song.
+        Returns a dict mapping (chromatic position, octave) to a number of notes, where the octave is None for notes written without octave,
+        and the chromatic position is None for notes that are not in the chromatic scale. Wrongly formatted notes are left out.
+        """
+        histogram = {}
+        for (note, count) in note_counts.items():
+            if self.is_valid_note_name_with_octave(note):
+                note_name = self.get_note_name(note)
+                note_octave = self.get_note_octave(note)
+            elif self.is_valid_note_name(note):
+                note_name = note
+                note_octave = None
+            else:
+                continue
+            try:
+                chromatic_position = self.convert_note_name_into_chromatic_position(note_name)
+            except KeyError:
+                chromatic_position = None
+            except SyntaxError:
+                continue
+            histogram[(chromatic_position, note_octave)] = histogram.get((chromatic_position, note_octave), 0) + count
+
+        return histogram
+
+    def get_major_scale_mask(self, song_key):
+
+        """
+        Returns the set of the chromatic positions in the major scale of song_key
+        """
+        song_key_chromatic_equivalent = self.get_song_key_chromatic_position(song_key)
+
+        return {(song_key_chromatic_equivalent + semitones) % self.get_chromatic_scale_count()
+                for semitones in self.get_semitone_interval_to_major_scale_interval()}
+
+    def count_notes_out_of_key(self, histogram, song_key):
+
+        """
+        Returns the number of notes of a pitch histogram that would be broken in song_key:
+        notes out of the chromatic scale, out of the major scale of song_key, or out of the range of the instrument.
+        The notes of the major scale are placed by compute_coordinate_for_pitch, as when calculating their coordinates with is_finding_key=True
+        """
+        song_key_chromatic_equivalent = self.get_song_key_chromatic_position(song_key)
+        scale_mask = self.get_major_scale_mask(song_key)
+
+        num_out = 0
+        for ((chromatic_position, note_octave), count) in histogram.items():
+            if chromatic_position not in scale_mask:
+                num_out += count
+                continue
+            if note_octave is None:
+                note_octave = self.get_octave_of_note_without_octave(chromatic_position, song_key_chromatic_equivalent)
+            note_coordinate = self.compute_coordinate_for_pitch(chromatic_position, note_octave, song_key_chromatic_equivalent)
+            if not self.is_coordinate_in_range(note_coordinate):
+                num_out += count
+
+        return num_out
 
     def convert_base_10_to_base_7(self, num):
         n = 3
@@ -53,7 +53,7 @@ class SkyABC15(noteparser.NoteParser):
         self.shape = shape
         self.__set_coord_maps__(shape)                
 
-    def calculate_coordinate_for_note(self, note, song_key=None, note_shift=0, is_finding_key=False):
+    def compute_coordinate_for_note(self, note, song_key=None, note_shift=0, is_finding_key=False):
         """
         Returns a tuple containing the row index and the column index of the note's position.
         """
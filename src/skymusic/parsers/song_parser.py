@@ -1,4 +1,5 @@
-import os, re
+import os, re, itertools, pickle
+import concurrent.futures
 from skymusic import instruments, sheetlayout, Lang
 from skymusic.modes import InputMode, InstrumentType
 from skymusic.song import Song
@@ -22,6 +23,11 @@ class SongParser:
     _num_errors = 0
     _max_errors = 30
     
+    BRACKET_CHORD_REGEX = re.compile('((\(|\[)(?:\w|\s)+(\)|\]))')
+    BRACKETS_BLANKS_REGEX = re.compile('\[|\]|\(|\)|\s')
+    SCRIPT_TAGS_REGEX = re.compile('<\s*/*\s*script[^>]*>', re.I)
+    BLANKS_REGEX = re.compile('(\s){2,}')
+    
     def __init__(self, maker, silent_warnings=True):
 
         self.maker = maker
@@ -43,6 +49,8 @@ class SongParser:
         self.allowed_regex = ['\s', '\t', '\w', '\d', '\n', '\r', '\a', '\e', '\f', '\v', '\R']
         self.ruler_regex = Resources.DELIMITERS['lyric'] + r'{0,1}\s*(?P<code>' + r'|'.join(Resources.MARKDOWN_CODES['rulers']) + r')+\s*(?P<text>.*)'
         self.layer_regex = Resources.DELIMITERS['lyric'] + r'{0,1}\s*(?P<code>' + Resources.DELIMITERS['layer'] + r')+\s*(?P<text>.*)'
+        self.delimiter_regexes = {} # Regexes derived from the delimiters, compiled once per delimiter
+        self.skygrid_pool = instruments.SkygridPool() # Identical skygrids are shared by the harps of the song
         self.music_theory = music_theory.MusicTheory(self)
         try:
             self.locale = self.maker.get_locale()
@@ -156,6 +164,7 @@ class SongParser:
     def set_input_mode(self, input_mode):
         if isinstance(input_mode, InputMode):
             self.input_mode = input_mode
+            self.delimiter_regexes = {}
             self.set_note_parser(self.input_mode)
             self.check_delimiters()
         else:
@@ -198,8 +207,9 @@ class SongParser:
         """
         if delimiter is None:
             delimiter = self.quaver_delimiter
-            if delimiter in self.allowed_regex:
-                return re.compile(delimiter).split(icon)
+            regex = self.get_delimiter_regex('split', delimiter)
+            if regex is not None:
+                return regex.split(icon)
             else:
                 return icon.split(delimiter)
 
@@ -207,12 +217,13 @@ class SongParser:
         """
         Separates the chords from its repeat indicator
         """
+        parts = self.get_delimiter_regex('repeat', self.repeat_indicator).split(chord)
         try:
-            repeat = int(re.split(re.escape(self.repeat_indicator), chord)[1])
+            repeat = int(parts[1])
         except (IndexError, ValueError):
             repeat = 1
         else:
-            chord = re.split(re.escape(self.repeat_indicator), chord)[0]
+            chord = parts[0]
 
         return repeat, chord
 
@@ -277,23 +288,22 @@ class SongParser:
                     skygrid.set_note(highlighted_coords, start_frame + chord_idx, highlighted)
                     if highlighted: harp_silent = False
 
+        skygrid = self.skygrid_pool.intern(skygrid)
+
         results = [skygrid, harp_broken, harp_silent, repeat]
         return results
 
     def convert_bracket_chords(self, line):
         
-        bracket_chord = re.compile('((\(|\[)(?:\w|\s)+(\)|\]))')
-        brackets_blanks = re.compile('\[|\]|\(|\)|\s')
-        chord_matches = bracket_chord.finditer(line)
+        chord_matches = self.BRACKET_CHORD_REGEX.finditer(line)
         for match in chord_matches:
-            notes = brackets_blanks.sub('',match.group(0))
+            notes = self.BRACKETS_BLANKS_REGEX.sub('',match.group(0))
             line = line.replace(match.group(0), notes)
         return line
     
     def remove_script_tags(self,line):
         '''Remove HTML script tags in song text to prevent hacking'''
-        script_tags = re.compile('<\s*/*\s*script[^>]*>', re.I)
-        return script_tags.sub('',line)
+        return self.SCRIPT_TAGS_REGEX.sub('',line)
     
     def sanitize_line(self, line):
         """
@@ -304,20 +314,14 @@ class SongParser:
         if self.input_mode is not InputMode.SKYJSON:
             line = self.convert_bracket_chords(line)
         
-        line = re.sub('(\s){2,}', '\\1', line)  # removes surnumerous blank characters
+        line = self.BLANKS_REGEX.sub('\\1', line)  # removes surnumerous blank characters
         line = line.strip()
         
         line = self.remove_script_tags(line)
         
-        if self.icon_delimiter in self.allowed_regex:
-            delimiter = self.icon_delimiter
-        elif self.icon_delimiter==' ':
-            delimiter = '\s'
-        else:
-            delimiter = re.escape(self.icon_delimiter)       
-
-        line = re.sub('(' + delimiter + ')' + '{2,}', '\\1', line)  # removes surnumerous delimiters
-        line = re.sub('^'+delimiter+'|'+delimiter+'$','', line) #strip delimiters on edges
+        (repeated_regex, edges_regex) = self.get_delimiter_regex('sanitize', self.icon_delimiter)
+        line = repeated_regex.sub('\\1', line)  # removes surnumerous delimiters
+        line = edges_regex.sub('', line) #strip delimiters on edges
         
         return line
 
@@ -334,15 +338,50 @@ class SongParser:
             else:
                 delimiter = self.icon_delimiter
             
-        if delimiter in self.allowed_regex:
-            return re.compile(delimiter).split(line)
-        elif delimiter=="#":# to allow HTML/CSS hex color codes
-            return re.compile(r'(?<!"|\'|:|#)#').split(line)
-        elif delimiter=="%":# to allow percentages in HTML/CSS size attributes
-            return re.compile(r'%(?!"|\')').split(line)
+        regex = self.get_delimiter_regex('split', delimiter)
+        if regex is not None:
+            return regex.split(line)
         else:
             return line.split(delimiter)
 
+    def get_delimiter_regex(self, purpose, delimiter):
+        """
+        Returns the regex derived from a delimiter, compiled the first time it is used:
+        - 'split': the regex splitting a line or an icon, or None if str.split can be used
+        - 'sanitize': the regexes removing repeated delimiters and delimiters on the edges of a line
+        - 'repeat': the regex separating a chord from its repeat indicator
+        The regexes are stored per delimiter, so that changing a delimiter compiles new ones.
+        """
+        try:
+            return self.delimiter_regexes[(purpose, delimiter)]
+        except KeyError:
+            pass
+        
+        if purpose == 'split':
+            if delimiter in self.allowed_regex:
+                regex = re.compile(delimiter)
+            elif delimiter=="#":# to allow HTML/CSS hex color codes
+                regex = re.compile(r'(?<!"|\'|:|#)#')
+            elif delimiter=="%":# to allow percentages in HTML/CSS size attributes
+                regex = re.compile(r'%(?!"|\')')
+            else:
+                regex = None
+        elif purpose == 'sanitize':
+            if delimiter in self.allowed_regex:
+                pattern = delimiter
+            elif delimiter==' ':
+                pattern = '\s'
+            else:
+                pattern = re.escape(delimiter)
+            regex = (re.compile('(' + pattern + ')' + '{2,}'), re.compile('^'+pattern+'|'+pattern+'$'))
+        elif purpose == 'repeat':
+            regex = re.compile(re.escape(delimiter))
+        else:
+            raise SongParserError(f"Unknown delimiter regex purpose: {purpose}")
+        
+        self.delimiter_regexes[(purpose, delimiter)] = regex
+        return regex
+
 
     def parse_line(self, line, song_key=Resources.DEFAULT_KEY, note_shift=0):
         """
@@ -384,11 +423,10 @@ class SongParser:
                     # From here, real chords are still glued, quavers have been split in different list slots
                     skygrid, harp_broken, harp_silent, repeat = self.parse_chords(chords, song_key, note_shift)
                     
-                    harp = self.instrument_type.get_instrument()
+                    harp = self.instrument_type.get_instrument(skygrid=skygrid)
                     harp.set_repeat(repeat)
                     harp.set_is_silent(harp_silent)
                     harp.set_is_broken(harp_broken)
-                    harp.set_skygrid(skygrid)
 
                     instrument_line.append(harp)
         
@@ -431,22 +469,100 @@ class SongParser:
         return (changed, meta_data)
 
 
-    def parse_song(self, song_lines, song_key, octave_shift):
+    def parse_song(self, song_lines, song_key, octave_shift, num_workers=None):
         """
         Create a Song object from the textual song in 'song_lines'
         Requires knowledge of the input mode and the song key.
+        With num_workers > 1, text notations are parsed in chunks of lines by a pool of processes.
+        """
+        if num_workers is None: num_workers = Resources.parse_num_workers
+        
+        (song, song_lines, note_shift) = self.__read_song_head__(song_lines, song_key, octave_shift)
+        
+        if num_workers > 1 and self.input_mode not in [InputMode.SKYHTML, InputMode.MIDI, InputMode.SKYJSON]:
+            instrument_lines = self.iter_lines_in_pool(list(song_lines), song_key, note_shift, num_workers)
+        else:
+            instrument_lines = self.__iter_instrument_lines__(song_lines, song_key, note_shift)
+        
+        for instrument_line in instrument_lines:
+            song.add_line(instrument_line)
+
+        return song
+
+    def iter_lines_in_pool(self, song_lines, song_key, note_shift, num_workers):
+        """
+        Parses chunks of song lines concurrently in worker processes, and yields the lines of instruments in song order.
+        The skygrids parsed by the workers are shared again by the harps of the song.
+        """
+        chunk_size = Resources.PARSE_CHUNK_SIZE
+        chunks = [song_lines[i:i+chunk_size] for i in range(0, len(song_lines), chunk_size)]
+        
+        num_done = 0
+        if len(chunks) > 1:
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=min(num_workers, len(chunks)),
+                                                            initializer=_init_parse_worker,
+                                                            initargs=(self, song_key, note_shift)) as executor:
+                    for packed_lines in executor.map(_parse_chunk_in_worker, chunks):
+                        for packed_line in packed_lines:
+                            yield [self.__unpack_instrument__(packed) for packed in packed_line]
+                        num_done += 1
+            except (OSError, RuntimeError, pickle.PicklingError) as err:
+                print(f"\n***WARNING: Could not parse the song in parallel ({err}). Parsing it line by line.")
+        
+        for chunk in chunks[num_done:]:
+            yield from self.__iter_instrument_lines__(chunk, song_key, note_shift)
+
+    def __unpack_instrument__(self, packed):
+        """
+        Rebuilds a harp sent by a worker process as a (skygrid, repeat, is_silent, is_broken) tuple, which is faster to transfer.
+        Other instruments are sent as they are.
+        """
+        if not isinstance(packed, tuple):
+            return packed
+        (skygrid, repeat, harp_silent, harp_broken) = packed
+        harp = self.instrument_type.get_instrument(skygrid=self.skygrid_pool.intern(skygrid))
+        harp.set_repeat(repeat)
+        harp.set_is_silent(harp_silent)
+        harp.set_is_broken(harp_broken)
+        return harp
+
+    def __getstate__(self):
+        """The maker is not sent to the worker processes parsing songs in parallel"""
+        state = self.__dict__.copy()
+        state['maker'] = None
+        state['skygrid_pool'] = instruments.SkygridPool()
+        return state
+
+
+    def iter_song(self, song_lines, song_key, octave_shift):
+        """
+        Parses a song lazily: returns a Song holding the metadata only, and a generator of its lines of instruments.
+        'song_lines' can be a list of strings or a file handle: text notations are read and parsed one line at a time,
+        while the generator is consumed, whereas the HTML, MIDI and JSON formats are read entirely first.
+        The Song must not be rendered before the generator is exhausted, unless the lines are passed to the renderer.
+        Requires knowledge of the input mode and the song key.
+        """
+        (song, song_lines, note_shift) = self.__read_song_head__(song_lines, song_key, octave_shift)
+        
+        return (song, self.__iter_instrument_lines__(song_lines, song_key, note_shift))
+
+    def __read_song_head__(self, song_lines, song_key, octave_shift):
+        """
+        Creates the Song with its metadata
+        Returns the Song, an iterable of the song lines left to parse, and the note shift
         """
         if isinstance(song_lines, str):  # Break newlines and make sure the result is a List
             song_lines = song_lines.strip().split(os.linesep)
             
         if self.input_mode == InputMode.SKYHTML:
-            song_lines = HtmlSongParser().parse_html(song_lines)
+            song_lines = HtmlSongParser().parse_html(list(song_lines))
         elif self.input_mode == InputMode.MIDI:
-            song_lines = MidiSongParser(self.maker, self.silent_warnings).parse_midi(song_lines)
+            song_lines = MidiSongParser(self.maker, self.silent_warnings).parse_midi(list(song_lines))
         elif self.input_mode == InputMode.SKYJSON:
             from . import json_parser
             parser = json_parser.JsonSongParser(self.maker, self.silent_warnings)
-            song_lines = parser.sanitize_lines(song_lines,join=True)
+            song_lines = parser.sanitize_lines(list(song_lines),join=True)
             
         english_song_key = self.english_note_name(song_key)
 
@@ -456,7 +572,13 @@ class SongParser:
         song = Song(locale=self.locale, music_key=english_song_key)
         
         # Metadata first, indicates by a special character such as #$
-        (changed, meta_data) = self.parse_metadata(song_lines, song)
+        if self.input_mode == InputMode.SKYJSON:
+            head_lines = song_lines
+        else:
+            # Reads the lines up to the first line that is not metadata, and puts them back in front of the others
+            (head_lines, song_lines) = self.__read_metadata_lines__(song_lines)
+        
+        (changed, meta_data) = self.parse_metadata(head_lines, song)
         if changed:
             song.set_meta(**meta_data)
             song.set_meta_changed(True)
@@ -467,11 +589,52 @@ class SongParser:
             parser.set_input_mode(self.input_mode)
             song_lines = parser.parse_layers(song_lines[0])                                          
         
-        # IMPORTANT: at this point song_lines is a list of strings                                                                                                                                                                                                                                                                                                                                                                  
+        return (song, song_lines, note_shift)
+
+    def __read_metadata_lines__(self, song_lines):
+        """
+        Reads the first lines of an iterable of song lines, up to the first line that is not metadata
+        Returns these lines, and an iterator over all the lines
+        """
+        lines_iter = iter(song_lines)
+        regexp = re.escape(Resources.DELIMITERS['metadata']) + '([^:]+):*(.*)'
+        head_lines = []
+        for line in lines_iter:
+            head_lines.append(line)
+            line = self.sanitize_line(line)
+            if line and not re.match(regexp,line):
+                break
+        
+        return (head_lines, itertools.chain(head_lines, lines_iter))
+
+    def __iter_instrument_lines__(self, song_lines, song_key, note_shift):
+        """Yields the non-empty lines of instruments parsed from song_lines"""
+        # IMPORTANT: at this point song_lines is an iterable of strings
         for song_line in song_lines:
             instrument_line = self.parse_line(song_line, song_key,
                                               note_shift)  # The song key must be in the original format
-            song.add_line(instrument_line)
+            if len(instrument_line) > 0:
+                yield instrument_line
 
-        return song
-        
+
+# Process-wide state of the worker processes parsing songs in parallel
+_worker_parser = None
+_worker_song_key = None
+_worker_note_shift = 0
+
+def _init_parse_worker(song_parser, song_key, note_shift):
+    global _worker_parser, _worker_song_key, _worker_note_shift
+    
+    _worker_parser = song_parser
+    _worker_song_key = song_key
+    _worker_note_shift = note_shift
+
+def _pack_instrument(instrument):
+    if instrument.get_type() in instruments.HARPS:
+        return (instrument.skygrid, instrument.get_repeat(), instrument.get_is_silent(), instrument.get_is_broken())
+    else:
+        return instrument
+
+def _parse_chunk_in_worker(song_lines):
+    return [[_pack_instrument(instrument) for instrument in instrument_line]
+            for instrument_line in _worker_parser.__iter_instrument_lines__(song_lines, _worker_song_key, _worker_note_shift)]
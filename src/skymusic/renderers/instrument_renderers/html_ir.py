@@ -35,7 +35,7 @@ class HtmlInstrumentRenderer(instrument_renderer.InstrumentRenderer):
             #harp_render += '\n'
             for col in range(cols):
                 note = instrument.get_note_from_position((row, col))
-                note_render = note_renderer.render(note)   
+                note_render = note_renderer.render(note, instrument)   
                 harp_render += note_render
         harp_render += '</div>' 
 
@@ -19,6 +19,7 @@ class MidiInstrumentRenderer(instrument_renderer.InstrumentRenderer):
 
         self.note_ticks = note_ticks
         self.music_key = music_key
+        self.note_renderer = midi_nr.MidiNoteRenderer(music_key=music_key) # Shared by all the instruments of the song
         relspacing = 0.1  # Spacing between midi notes, as a ratio of note duration
         #midi_pause_relticks = 1  # Spacing between midi notes, as a ratio of note duration
         quaver_relspacing = 0.1
@@ -36,11 +37,11 @@ class MidiInstrumentRenderer(instrument_renderer.InstrumentRenderer):
             for row in range(instrument.get_row_count()):
                 for col in range(instrument.get_column_count()):
                     note = instrument.get_note_from_position((row, col))
-                    frames = note.get_highlighted_frames()
+                    frames = note.get_highlighted_frames(instrument)
                     if frames:
                         if frames[0] == 0:
                         # A chord note has a frame index==0
-                            note_render = note_renderer.render(note, event_type, t)
+                            note_render = note_renderer.render(note, instrument, event_type, t)
         
                             if isinstance(note_render, mido.Message):
                                 harp_render.append(note_render)
@@ -51,7 +52,7 @@ class MidiInstrumentRenderer(instrument_renderer.InstrumentRenderer):
 
     def render_icon(self, instrument):
         
-        note_renderer = midi_nr.MidiNoteRenderer(music_key=self.music_key)
+        note_renderer = self.note_renderer
         #harp_render = []
         
         render_args = []
@@ -64,9 +65,9 @@ class MidiInstrumentRenderer(instrument_renderer.InstrumentRenderer):
                 coords = instrument.get_highlighted_coords(frame)
                 notes = [instrument.get_note_from_position(coord) for coord in coords]
                 for note in notes:                                     
-                    render_args.append({'note':note,'event_type':'note_on','t':t})                
+                    render_args.append({'note':note,'instrument':instrument,'event_type':'note_on','t':t})                
                     note_duration = self.delta_times['note_off'] if frame == 0 else self.delta_times['quaver_off']
-                    render_args.append({'note':note,'event_type':'note_off','t':t+note_duration})                        
+                    render_args.append({'note':note,'instrument':instrument,'event_type':'note_off','t':t+note_duration})                        
                 if frame > 0:
                     t += self.delta_times['quaver_on']
         
@@ -86,6 +87,37 @@ class MidiInstrumentRenderer(instrument_renderer.InstrumentRenderer):
         return harp_render
 
 
+    def render_harp_events(self, instrument):
+        """
+        Returns the MIDI events of a harp as (event_type, pitch, velocity, delta_t) tuples, without creating mido messages.
+        The events are the same as the messages returned by render_harp.
+        """
+        if instrument.get_is_dead():
+            return [('note_on', 120, 127, int(self.delta_times['note_on'])), ('note_off', 120, 127, int(self.delta_times['note_off']))]
+        elif instrument.get_is_silent():
+            return [('note_on', 115, 0, int(self.delta_times['note_on'])), ('note_off', 115, 0, int(self.delta_times['note_off']))]
+        
+        timed_events = []
+        t = self.delta_times['note_on']
+        for frame in range(instrument.get_frame_count()):
+            note_duration = self.delta_times['note_off'] if frame == 0 else self.delta_times['quaver_off']
+            for coord in instrument.get_highlighted_coords(frame):
+                pitch = self.note_renderer.get_note_pitch(instrument.get_note_from_position(coord))
+                timed_events.append((t, 'note_on', pitch))
+                timed_events.append((t+note_duration, 'note_off', pitch))
+            if frame > 0:
+                t += self.delta_times['quaver_on']
+        
+        timed_events.sort(key=lambda v:v[0]) #sort by absolute time
+        
+        harp_events = []
+        prev_t = 0
+        for (t, event_type, pitch) in timed_events:
+            harp_events.append((event_type, pitch, 64, int(t - prev_t)))
+            prev_t = t
+        
+        return harp_events
+
     def render_harp(self, instrument):
         harp_silent = instrument.get_is_silent()
         #harp_broken = instrument.get_is_broken()
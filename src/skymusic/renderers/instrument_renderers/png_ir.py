@@ -1,5 +1,8 @@
 from . import instrument_renderer
+from skymusic.cache import LRUCache
 from skymusic.resources import Resources
+from skymusic.instruments import Voice
+from skymusic.sheetlayout import Ruler
 from skymusic.renderers.note_renderers import png_nr
 
 
@@ -11,6 +14,70 @@ except (ImportError, ModuleNotFoundError):
     no_PIL_module = True
 
 
+class HarpSpriteCache(LRUCache):
+    """
+    A least-recently-used cache of rendered harp images.
+    Songs reuse a small vocabulary of chords, so identical harps are rendered once and pasted many times.
+    Cached images are shared and must not be modified.
+    The cache is bounded by the bytes of its images.
+    """
+    def __init__(self, max_size=0):
+        super().__init__(max_size, get_size=lambda im: len(im.getbands())*im.width*im.height)
+
+    def get_key(self, instrument, harp_type, rescale):
+        '''Returns a hashable key describing everything that changes the look of a harp. The repeat is drawn apart, so it is left out'''
+        return (Resources.loaded_theme, harp_type, instrument.get_shape(), instrument.skygrid.get_render_key(),
+                instrument.get_is_broken(), instrument.get_is_silent(), rescale)
+
+
+# Rendered harps, shared by all PNG renderers and bounded by Resources.png_sprite_cache_size
+harp_sprites = HarpSpriteCache()
+
+
+class FontCache():
+    """
+    Fonts loaded once per process, keyed by (path, size), and the sizes of the texts already measured with them.
+    Renderers are created for every song and harp type, while the CJK font file is large and slow to open.
+    """
+    def __init__(self, max_text_sizes=4096):
+        self.fonts = {}
+        self.text_sizes = {}
+        self.max_text_sizes = max_text_sizes
+
+    def get_font(self, font_path, font_size):
+        '''Returns the TrueType font at font_path, or the default PIL font if it cannot be opened'''
+        key = (font_path, font_size)
+        try:
+            return self.fonts[key]
+        except KeyError:
+            pass
+        try:
+            font = ImageFont.truetype(font_path, font_size)
+        except OSError:
+            font = ImageFont.load_default()
+        self.fonts[key] = font
+        return font
+
+    def get_text_size(self, font, text):
+        '''Cached equivalent of font.getsize(text)'''
+        key = (getattr(font, 'path', None), getattr(font, 'size', None), text)
+        try:
+            return self.text_sizes[key]
+        except KeyError:
+            size = font.getsize(text)
+            if len(self.text_sizes) >= self.max_text_sizes:
+                self.text_sizes.clear()
+            self.text_sizes[key] = size
+            return size
+
+    def clear(self):
+        self.fonts.clear()
+        self.text_sizes.clear()
+
+
+fonts = FontCache()
+
+
 class PngInstrumentRenderer(instrument_renderer.InstrumentRenderer):
     
     def __init__(self, locale=None, harp_type='harp'):
@@ -31,31 +98,35 @@ class PngInstrumentRenderer(instrument_renderer.InstrumentRenderer):
         self.repeat_height = None
         self.voice_font_size = Resources.voice_font_size
         self.hr_color = Resources.hr_color  # Transparent white
-        try:
-            self.voice_font = ImageFont.truetype(self.font_path, self.voice_font_size)
-            self.harp_font = ImageFont.truetype(self.font_path, self.harp_font_size)
-            self.h1_font = ImageFont.truetype(self.png_font_path, self.png_h1_font_size)
-            self.h2_font = ImageFont.truetype(self.png_font_path, self.png_h2_font_size)
-            self.text_font = ImageFont.truetype(self.png_font_path, self.png_font_size)
-        except OSError:
-            self.voice_font = ImageFont.load_default()
-            self.harp_font = ImageFont.load_default()
-            self.h1_font = ImageFont.load_default()
-            self.h2_font = ImageFont.load_default()
-            self.text_font = ImageFont.load_default()
+        self.voice_font = fonts.get_font(self.font_path, self.voice_font_size)
+        self.harp_font = fonts.get_font(self.font_path, self.harp_font_size)
+        self.h1_font = fonts.get_font(self.png_font_path, self.png_h1_font_size)
+        self.h2_font = fonts.get_font(self.png_font_path, self.png_h2_font_size)
+        self.text_font = fonts.get_font(self.png_font_path, self.png_font_size)
 
         self.png_harp_size = None
         self.harp_type = harp_type
         self.empty_harp_png = Resources.PNGS[f'empty-{harp_type}']
         self.unhighlighted_harp_png = Resources.PNGS[f'unhighlighted-{harp_type}']
+        harp_sprites.resize(Resources.png_sprite_cache_size)
 
     def trans_paste(self, bg, fg, box=(0, 0)):
+        """Alpha-composites fg over bg at box, blending only the region covered by fg"""
         if fg.mode == 'RGBA':
             if bg.mode != 'RGBA':
                 bg = bg.convert('RGBA')
-            fg_trans = Image.new('RGBA', bg.size)
-            fg_trans.paste(fg, box, mask=fg)  # transparent foreground
-            return Image.alpha_composite(bg, fg_trans)
+            (x, y) = box
+            # Clips the foreground to the background bounds
+            (x0, y0) = (max(0, x), max(0, y))
+            (x1, y1) = (min(bg.size[0], x + fg.size[0]), min(bg.size[1], y + fg.size[1]))
+            if x1 <= x0 or y1 <= y0:
+                return bg
+            if (x0, y0, x1, y1) != (x, y, x + fg.size[0], y + fg.size[1]):
+                fg = fg.crop((x0 - x, y0 - y, x1 - x, y1 - y))
+            fg_trans = Image.new('RGBA', fg.size)
+            fg_trans.paste(fg, mask=fg)  # transparent foreground
+            bg.paste(Image.alpha_composite(bg.crop((x0, y0, x1, y1)), fg_trans), (x0, y0))
+            return bg
         else:
             if bg.mode == 'RGBA':
                 bg = bg.convert('RGB')
@@ -74,6 +145,35 @@ class PngInstrumentRenderer(instrument_renderer.InstrumentRenderer):
             self.set_png_harp_size()
         return self.png_harp_size
 
+    def get_max_rescale(self, size, rescale=1.0, max_size=None):
+        """Reduces the rescale factor so that an image of this size fits into max_size"""
+        if max_size is not None:
+            rescale =  min(rescale,max_size[0]/size[0])
+            rescale =  min(rescale,max_size[1]/size[1])
+        return rescale
+
+    def get_render_size(self, instrument, rescale=1.0, max_size=None):
+        """Returns the size of the image that render() would return, without drawing anything"""
+        if isinstance(instrument, Ruler):
+            return (int(max_size[0]), int(max_size[1]))
+        elif isinstance(instrument, Voice):
+            lyric_width = fonts.get_text_size(self.voice_font, instrument.get_lyric(strip_html=True))[0]
+            size = (int(max(self.get_png_harp_size()[0], lyric_width)), int(self.get_lyric_height()))
+        else:
+            size = self.get_png_harp_size()
+
+        rescale = self.get_max_rescale(size, rescale, max_size)
+        if rescale != 1:
+            size = (int(size[0] * rescale), int(size[1] * rescale))
+        return size
+
+    def get_repeat_size(self, max_rescaled_width, rescale=1):
+        """Returns the size of the image that get_repeat_png() would return"""
+        size = (int(max_rescaled_width / rescale), int(self.get_png_harp_size()[1]))
+        if rescale != 1:
+            size = (int(size[0] * rescale), int(size[1] * rescale))
+        return size
+
     def get_repeat_png(self, instrument, max_rescaled_width, rescale=1):
         """Returns an image of the repeat number xN"""
         repeat_im = Image.new('RGBA', (int(max_rescaled_width / rescale), int(self.get_png_harp_size()[1])),
@@ -81,7 +181,7 @@ class PngInstrumentRenderer(instrument_renderer.InstrumentRenderer):
         draw = ImageDraw.Draw(repeat_im)
         #fnt = ImageFont.truetype(self.font_path, self.harp_font_size)
         fnt = self.harp_font
-        draw.text((0, repeat_im.size[1] - 1.05 * fnt.getsize(str(instrument.get_repeat()))[1]), 'x' + str(instrument.get_repeat()), font=fnt,
+        draw.text((0, repeat_im.size[1] - 1.05 * fonts.get_text_size(fnt, str(instrument.get_repeat()))[1]), 'x' + str(instrument.get_repeat()), font=fnt,
                   fill=self.font_color)
 
         if rescale != 1:
@@ -95,10 +195,10 @@ class PngInstrumentRenderer(instrument_renderer.InstrumentRenderer):
         """Calculates the height of the lyrics based on a standard text and the font size"""
         #fnt = ImageFont.truetype(self.font_path, self.voice_font_size)
         fnt = self.voice_font
-        return fnt.getsize('HQfgjyp')[1] #Uppercase H and characters with tails
+        return fonts.get_text_size(fnt, 'HQfgjyp')[1] #Uppercase H and characters with tails
 
     def __scaled_font__(self, font_size, rescale):
-        return ImageFont.truetype(self.png_font_path, int(font_size*rescale))
+        return fonts.get_font(self.png_font_path, int(font_size*rescale))
    
     def render_ruler(self, ruler, rescale=1.0, max_size=None): # Should add options
         """Renders an horizontal ruler"""
@@ -151,7 +251,7 @@ class PngInstrumentRenderer(instrument_renderer.InstrumentRenderer):
         harp_size = self.get_png_harp_size()
         #fnt = ImageFont.truetype(self.font_path, int(self.voice_font_size))
         fnt = self.voice_font
-        lyric_width = fnt.getsize(lyric)[0]
+        lyric_width = fonts.get_text_size(fnt, lyric)[0]
 
         lyric_render = Image.new('RGBA', (int(max(harp_size[0], lyric_width)), int(self.get_lyric_height())),
                              color=self.text_bkg)
@@ -165,10 +265,7 @@ class PngInstrumentRenderer(instrument_renderer.InstrumentRenderer):
             draw.text((0, 0), lyric, font=fnt, fill=self.font_color)
 
         # Rescaling
-        if max_size is not None:
-            rescale =  min(rescale,max_size[0]/lyric_render.size[0])
-            rescale =  min(rescale,max_size[1]/lyric_render.size[1])
-
+        rescale = self.get_max_rescale(lyric_render.size, rescale, max_size)
         if rescale != 1:
             lyric_render = lyric_render.resize((int(lyric_render.size[0] * rescale), int(lyric_render.size[1] * rescale)),
                                        resample=Image.LANCZOS)
@@ -176,6 +273,21 @@ class PngInstrumentRenderer(instrument_renderer.InstrumentRenderer):
 
 
     def render_harp(self, instrument, rescale=1.0, max_size=None):
+        """
+        Renders the harp in PNG, or returns an identical harp already rendered.
+        The returned image is shared by all identical harps, so it is read-only: it may be pasted,
+        but never passed as the background of trans_paste, which draws on the background in place.
+        """
+        rescale = self.get_max_rescale(self.get_png_harp_size(), rescale, max_size)
+        sprite_key = harp_sprites.get_key(instrument, self.harp_type, rescale)
+        harp_render = harp_sprites.get(sprite_key)
+        if harp_render is None:
+            harp_render = self.draw_harp(instrument, rescale)
+            harp_sprites.put(sprite_key, harp_render)
+
+        return harp_render
+
+    def draw_harp(self, instrument, rescale=1.0):
 
         harp_silent = instrument.get_is_silent()
         harp_broken = instrument.get_is_broken()
@@ -189,7 +301,7 @@ class PngInstrumentRenderer(instrument_renderer.InstrumentRenderer):
         
         # Get a typical note to check that the size of the note png is consistent with the harp png                  
         #note_size = notes.Note(instrument).get_png_size()
-        note_size = png_nr.PngNoteRenderer().get_png_size()
+        note_size = note_renderer.get_png_size()
         
         note_rel_width = note_size[0] / harp_size[0]  # percentage of harp
         if note_rel_width > 1.0 / instrument.get_column_count() or note_rel_width < 0.05:
@@ -219,19 +331,15 @@ class PngInstrumentRenderer(instrument_renderer.InstrumentRenderer):
                     # note.set_position(row, col)
 
                     # NOTE RENDER
-                    if len(note.get_highlighted_frames()) > 0:  # Only paste highlighted notes
+                    if len(note.get_highlighted_frames(instrument)) > 0:  # Only paste highlighted notes
                         xn = (xn0 + col * (1 - 2 * xn0) / (instrument.get_column_count() - 1)) * harp_size[0] - note_size[
                             0] / 2.0
                         yn = (yn0 + row * (1 - 2 * yn0) / (instrument.get_row_count() - 1)) * harp_size[1] - note_size[
                             1] / 2.0
-                        note_render = note_renderer.render(note=note, rescale=note_rescale)
+                        note_render = note_renderer.render(note=note, instrument=instrument, rescale=note_rescale)
                         harp_render = self.trans_paste(harp_render, note_render, (int(round(xn)), int(round(yn))))
 
         # Rescaling
-        if max_size is not None:
-            rescale =  min(rescale,max_size[0]/harp_render.size[0])
-            rescale =  min(rescale,max_size[1]/harp_render.size[1])
-
         if rescale != 1:
             harp_render = harp_render.resize((int(harp_render.size[0] * rescale), int(harp_render.size[1] * rescale)),
                                              resample=Image.LANCZOS)
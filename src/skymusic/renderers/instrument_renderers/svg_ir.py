@@ -1,10 +1,13 @@
+import hashlib
 from . import instrument_renderer
 from skymusic.renderers.note_renderers.svg_nr import SvgNoteRenderer
 
 class SvgInstrumentRenderer(instrument_renderer.InstrumentRenderer):
     
-    def __init__(self, locale=None):
+    def __init__(self, locale=None, use_symbols=False):
         super().__init__(locale)
+        self.use_symbols = use_symbols # Harps are drawn by referencing shared <symbol> elements
+        self.symbols = {}
 
 
     def render_ruler(self, ruler, x, width: str, height: str, aspect_ratio):
@@ -61,10 +64,8 @@ class SvgInstrumentRenderer(instrument_renderer.InstrumentRenderer):
         return voice_render
 
 
-    def render_harp(self, instrument, x, harp_width, harp_height, aspect_ratio):
-        """
-        Renders the Instrument in SVG
-        """
+    def get_harp_class(self, instrument):
+        """Returns the CSS classes of the harp SVG container, which style broken and silent harps"""
         instr_silent = instrument.get_is_silent()
         instr_broken = instrument.get_is_broken()
         instr_type = instrument.get_type()
@@ -76,20 +77,40 @@ class SvgInstrumentRenderer(instrument_renderer.InstrumentRenderer):
         else:
             instr_state = ""
             
-        css_class = " ".join(filter(None,["instr", instr_type, instr_state]))
+        return " ".join(filter(None,["instr", instr_type, instr_state]))
 
-        note_renderer = SvgNoteRenderer()
+    def render_harp(self, instrument, x, harp_width, harp_height, aspect_ratio):
+        """
+        Renders the Instrument in SVG
+        """
+        if self.use_symbols:
+            # A reference to the harp drawing, defined once per page
+            (symbol_id, _) = self.get_harp_symbol(instrument)
+            return (f'<use xlink:href="#{symbol_id}" x="{x :.2f}" y="0" width="{harp_width}" height="{harp_height}" '
+                    f'id="instr-{instrument.get_index()}" />')
 
         # The harp SVG container
-        harp_render = f'<svg x="{x :.2f}" y="0" width="{harp_width}" height="{harp_height}" class="{css_class}" id="instr-{instrument.get_index()}">'
+        harp_render = [f'<svg x="{x :.2f}" y="0" width="{harp_width}" height="{harp_height}" class="{self.get_harp_class(instrument)}" id="instr-{instrument.get_index()}">']
+        harp_render.append(self.render_harp_content(instrument))
+        harp_render.append('\n</svg>')
+
+        return ''.join(harp_render)
+
+    def render_harp_content(self, instrument):
+        """
+        Renders the inside of the harp SVG container: the harp table and the notes
+        """
+        note_renderer = SvgNoteRenderer()
+        
+        harp_render = []
 
         # The harp rectangle with rounded edges
         #harp_render += f'<rect x="0.7%" y="0.7%" width="98.6%" height="98.6%" rx="7.5%" ry="{7.5 * aspect_ratio :.2f}%" class="{instrument.get_type()} {instrument.get_type()}-{instrument.get_index()}"/>'
-        if not instr_broken and not instr_silent:
-            harp_render += '\n<use xlink:href="#instr" />'
+        if not instrument.get_is_broken() and not instrument.get_is_silent():
+            harp_render.append('\n<use xlink:href="#instr" />')
 
         for row in range(instrument.get_row_count()):
-            harp_render += '\n'
+            harp_render.append('\n')
             for col in range(instrument.get_column_count()):
                 note = instrument.get_note_from_position((row, col))
                 
@@ -101,8 +122,22 @@ class SvgInstrumentRenderer(instrument_renderer.InstrumentRenderer):
                 yn = yn0 + row * (1 - 2 * yn0*1.07) / (instrument.get_row_count() - 1) - note_width / 2.0
 
                 # NOTE RENDER
-                harp_render += note_renderer.render(note, xs=f"{100*xn :.2f}%", ys=f"{100*yn :.2f}%", widths=f"{100*note_width :.2f}%")
-                
-        harp_render += '\n</svg>'
+                harp_render.append(note_renderer.render(note, instrument, xs=f"{100*xn :.2f}%", ys=f"{100*yn :.2f}%", widths=f"{100*note_width :.2f}%"))
+
+        return ''.join(harp_render)
 
-        return harp_render
+    def get_harp_symbol(self, instrument):
+        """
+        Returns the id and the content of the <symbol> drawing this harp
+        The id is derived from the content, so that identical harps share the same symbol in every page and every song
+        The content is wrapped in the harp SVG container, whose classes the CSS of broken and silent harps selects on
+        """
+        key = instrument.get_render_key()
+        try:
+            return self.symbols[key]
+        except KeyError:
+            content = (f'\n<svg width="100%" height="100%" class="{self.get_harp_class(instrument)}">'
+                       f'{self.render_harp_content(instrument)}\n</svg>')
+            symbol = (f"harp-{hashlib.md5(content.encode('utf-8')).hexdigest()[:12]}", content)
+            self.symbols[key] = symbol
+            return symbol
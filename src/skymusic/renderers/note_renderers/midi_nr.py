@@ -1,4 +1,5 @@
 from skymusic.resources import Resources
+from skymusic import notes
 from . import note_renderer
 
 try:
@@ -8,25 +9,51 @@ except (ImportError, ModuleNotFoundError):
     no_mido_module = True
 
 
+pitch_tables = {} # (music_key, shape) -> {position: MIDI pitch}
+
+def get_pitch(music_key, note_index):
+    """
+    Returns the MIDI pitch of the note at an index of Sky grid, assuming a chromatic scale (12 semitones)
+    """
+    octave = int(note_index / 7) #7 because of the heptatonic tone scale of Sky (no accidentals)
+    semi = Resources.MIDI_SEMITONES[int(note_index) % 7]
+    try:
+        root_pitch = Resources.MIDI_PITCHES[music_key]
+    except KeyError:
+        root_pitch = Resources.MIDI_PITCHES[Resources.DEFAULT_KEY]
+        
+    return root_pitch + octave * 12 + semi
+
+def get_pitch_table(music_key, shape):
+    """Returns the MIDI pitches of the notes of an instrument grid, computed once per music key and shape"""
+    try:
+        return pitch_tables[(music_key, shape)]
+    except KeyError:
+        pitch_table = {(row, col): get_pitch(music_key, notes.get_note(shape, (row, col)).get_index())
+                       for row in range(shape[0]) for col in range(shape[1])}
+        pitch_tables[(music_key, shape)] = pitch_table
+        return pitch_table
+
+
 class MidiNoteRenderer(note_renderer.NoteRenderer):
 
     def __init__(self, music_key=Resources.DEFAULT_KEY):
         self.music_key = music_key
 
-    def render(self, note, event_type, delta_t=0):
+    def get_note_pitch(self, note):
+        """Returns the MIDI pitch of a note, read from the pitch table of its instrument shape"""
+        try:
+            return get_pitch_table(self.music_key, note.get_shape())[note.get_position()]
+        except KeyError: # Notes outside of the grid
+            return get_pitch(self.music_key, note.get_index())
+
+    def render(self, note, instrument, event_type, delta_t=0):
         """
         Starts or ends a MIDI note, assuming a chromatic scale (12 semitones)
         """
-        octave = int(note.get_index() / 7) #7 because of the heptatonic tone scale of Sky (no accidentals)
-        semi = Resources.MIDI_SEMITONES[int(note.get_index()) % 7]
-        try:
-            root_pitch = Resources.MIDI_PITCHES[self.music_key]
-        except KeyError:
-            root_pitch = Resources.MIDI_PITCHES[Resources.DEFAULT_KEY]
-            
-        note_pitch = root_pitch + octave * 12 + semi
+        note_pitch = self.get_note_pitch(note)
 
-        if len(note.get_highlighted_frames()) == 0:
+        if len(note.get_highlighted_frames(instrument)) == 0:
             midi_render = None
         else:
             midi_render = mido.Message(event_type, channel=0, note=note_pitch, velocity=64, time=int(delta_t))
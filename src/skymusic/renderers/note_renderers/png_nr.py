@@ -10,6 +10,10 @@ except (ImportError, ModuleNotFoundError):
     no_PIL_module = True
 
 
+note_atlas = {}
+# Decoded note images, shared by all renderers of the process: {(theme, rescale): {image name: Image}}
+
+
 class PngNoteRenderer(note_renderer.NoteRenderer):
 
     def __init__(self):
@@ -17,11 +21,36 @@ class PngNoteRenderer(note_renderer.NoteRenderer):
         self.rows_names = ['A', 'B', 'C']
         self.png_size = None
 
+    def get_atlas(self, rescale=1.0):
+        """Returns the dictionary of note images already decoded for the current theme and rescale factor"""
+        return note_atlas.setdefault((Resources.loaded_theme, rescale), {})
+
+    def get_image(self, name, rescale=1.0):
+        """
+        Returns the image 'name' of Resources.PNGS, decoded and rescaled only the first time it is requested.
+        The image is shared and must not be modified.
+        """
+        atlas = self.get_atlas(rescale)
+        try:
+            return atlas[name]
+        except KeyError:
+            pass
+        
+        if rescale != 1:
+            image = self.get_image(name)
+            image = image.resize((int(image.size[0] * rescale), int(image.size[1] * rescale)),
+                                 resample=Image.LANCZOS)
+        else:
+            image = Image.open(Resources.PNGS[name])
+            image.load()
+        
+        atlas[name] = image
+        return image
 
     def set_png_size(self):
         """Retrieves the original size of the .png image of a highlighted note"""
         if self.png_size is None:
-            self.png_size = Image.open(Resources.PNGS['A-root']).size
+            self.png_size = self.get_image('A-root').size
 
     def get_png_size(self):
         """Returns the original size of the .png image of a note"""
@@ -29,56 +58,50 @@ class PngNoteRenderer(note_renderer.NoteRenderer):
             self.set_png_size()
         return self.png_size
 
-    def get_dead_png(self):
+    def get_dead_png(self, rescale=1.0):
         """Renders a PNG of a grey note placeholder, in case we want to display an empty harp when it is broken, instead of a central question mark"""
-        return Image.open(Resources.PNGS['dead-note'])
+        return self.get_image('dead-note', rescale)
 
-    def get_unhighlighted_png(self, position):
+    def get_unhighlighted_png(self, position, rescale=1.0):
         """Renders a PNG of a colored note placholder, when the note is note is unplayed"""
         row_name = self.rows_names[position[0]]
         
         try:
-            note_png = Resources.PNGS[f"{row_name}-unhighlighted"]
-            return Image.open(note_png)
+            return self.get_image(f"{row_name}-unhighlighted", rescale)
         except AttributeError:
             print(f"\n***ERROR: Could not open {row_name}_unhighlighted note image.")
             return None
         
-    def get_png(self, aspect, position, highlighted_frames):
+    def get_png(self, aspect, position, highlighted_frames, rescale=1.0):
                 
         try:
             row_name = self.rows_names[position[0]]
-            note_png = Resources.PNGS[f"{row_name}-{aspect}"]
             
             if highlighted_frames[0] == 0:
-                return Image.open(note_png)
+                return self.get_image(f"{row_name}-{aspect}", rescale)
             else:
                 num = min(highlighted_frames[0], self.max_num_quavers)
-                return Image.open(Resources.PNGS[f"{aspect}-highlighted-{num}"])
+                return self.get_image(f"{aspect}-highlighted-{num}", rescale)
         except (IndexError, AttributeError):
             print(f"\n***ERROR: Could not open {aspect} note image at row {row_name}.")
             return None
 
 
-    def render(self, note, rescale=1.0):
+    def render(self, note, instrument, rescale=1.0):
         
         note_position = note.get_position()
 
-        if not note.instrument.get_is_broken() and not note.instrument.get_is_silent():
-            if not note.is_highlighted():
+        if not instrument.get_is_broken() and not instrument.get_is_silent():
+            if not note.is_highlighted(instrument):
                 # Draws a small button (will be colored thanks to CSS)
-                png_render = self.get_unhighlighted_png(note_position)
+                png_render = self.get_unhighlighted_png(note_position, rescale)
             else:
                 # Draws an highlighted note                
-                note_aspect = self.get_aspect(note)
-                highlighted_frames = note.get_highlighted_frames()
-                png_render = self.get_png(note_aspect, note_position, highlighted_frames)
+                note_aspect = self.get_aspect(note, instrument)
+                highlighted_frames = note.get_highlighted_frames(instrument)
+                png_render = self.get_png(note_aspect, note_position, highlighted_frames, rescale)
         else:
-            png_render = self.get_dead_png()
-
-        if rescale != 1:
-            png_render = png_render.resize((int(png_render.size[0] * rescale), int(png_render.size[1] * rescale)),
-                                             resample=Image.LANCZOS)
+            png_render = self.get_dead_png(rescale)
 
         return png_render
 
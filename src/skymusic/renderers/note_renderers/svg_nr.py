@@ -19,11 +19,11 @@ class SvgNoteRenderer(note_renderer.NoteRenderer):
         return f'<use xlink:href="#d{row_num}" x="{xs}" y="{ys}" width="{widths}" height="{widths}" />'
 
 
-    def render(self, note, xs="0%", ys="0%", widths="10%"):
+    def render(self, note, instrument, xs="0%", ys="0%", widths="10%"):
         
         (row, col) = note.get_position()
         try:
-            highlighted_frames = note.get_highlighted_frames()
+            highlighted_frames = note.get_highlighted_frames(instrument)
             if len(highlighted_frames) == 1 and highlighted_frames[0] == 0:
                 highlighted_classes = [f'r{row+1 :d}']
             else:
@@ -31,24 +31,24 @@ class SvgNoteRenderer(note_renderer.NoteRenderer):
         except KeyError:  # highlighted_frames==[]: note is not highlighted
             highlighted_classes = []
 
-        if note.instrument.get_is_broken() and ((row, col) == note.get_middle_position()):           
+        if instrument.get_is_broken() and ((row, col) == note.get_middle_position()):           
             highlighted_classes = []
             # Draws a special symbol when harp is broken
             note_core_render = self.get_harpbroken_svg(xs, ys, widths)
             
-        elif note.instrument.get_is_silent() and ((row, col) == note.get_middle_position()):            
+        elif instrument.get_is_silent() and ((row, col) == note.get_middle_position()):            
             highlighted_classes = []
             # Draws a special symbol when harp is silent
             note_core_render = self.get_silentsymbol_svg(xs, ys, widths)
             
         else:
             
-            if note.instrument.get_is_broken():
+            if instrument.get_is_broken():
                 # Draws a small button (will be grey thanks to CSS)
                 highlighted_classes = []
                 note_core_render = self.get_nonote_svg()              
                 
-            elif note.instrument.get_is_silent():                
+            elif instrument.get_is_silent():                
                 # Draws a small button (will be grey thanks to CSS)
                 highlighted_classes = []
                 note_core_render = self.get_nonote_svg()               
@@ -61,7 +61,7 @@ class SvgNoteRenderer(note_renderer.NoteRenderer):
                     
                 else:
                     # Draws an highlighted note
-                    aspect = self.get_aspect(note)
+                    aspect = self.get_aspect(note, instrument)
                     note_core_render = self.get_svg(aspect, xs, ys, widths, highlighted_classes)
         
            
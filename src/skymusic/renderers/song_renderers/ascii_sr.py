@@ -10,10 +10,15 @@ class AsciiSongRenderer(song_renderer.SongRenderer):
         
         super().__init__(locale) 
         
-    def write_buffers(self, song, render_mode):
-
+    def write_buffers(self, song, render_mode, lines=None, ascii_buffer=None):
+        """
+        Writes the song in a text buffer, line by line.
+        lines is an optional iterable of lines of instruments, read instead of the lines of the song, e.g. from SongParser.iter_song.
+        ascii_buffer is an optional text buffer or file to write to, instead of a new StringIO.
+        """
         meta = song.get_meta()
-        ascii_buffer = io.StringIO()
+        if ascii_buffer is None:
+            ascii_buffer = io.StringIO()
 
         start_octave = Resources.RENDERING_START_OCTAVE
         note_parser = render_mode.get_note_parser(locale=self.locale, start_octave=start_octave)
@@ -28,9 +33,11 @@ class AsciiSongRenderer(song_renderer.SongRenderer):
         if render_mode.get_is_chromatic():
             ascii_buffer.write("\n"+f"{Resources.DELIMITERS['metadata']}CAUTION: Conversion to a text file with a song key different from C (do, 1) is not supported yet. We assumed it was C."+"\n")
             ascii_buffer.write(f"{Resources.DELIMITERS['metadata']}We assumed the first octave of the instrument was: {start_octave}\n")
-        song_render = ''
+        if lines is None:
+            lines = song.get_lines()
+        
         instrument_index = 0
-        for line in song.get_lines():
+        for line in lines:
             line_render = ''
             for instrument in line:
                 instrument.set_index(instrument_index)
@@ -43,10 +50,10 @@ class AsciiSongRenderer(song_renderer.SongRenderer):
                 instrument_index += 1
                 
             line_render = line_render.rstrip(Resources.DELIMITERS['icon'])#Remove last space
-            song_render += '\n' + line_render
+            ascii_buffer.write('\n' + line_render)
 
-        ascii_buffer.write(song_render)
-        ascii_buffer.seek(0)
+        if ascii_buffer.seekable():
+            ascii_buffer.seek(0)
 
         return [ascii_buffer]
 
@@ -5,6 +5,11 @@ from skymusic.renderers.instrument_renderers.html_ir import HtmlInstrumentRender
 from skymusic.resources import Resources
 from skymusic.modes import CSSMode, RenderMode
 
+
+# Rendered instruments of each line, shared by all HTML renderers
+html_lines = song_renderer.LineFragmentCache()
+
+
 class HtmlSongRenderer(song_renderer.SongRenderer):
 
     def __init__(self, locale=None, theme=Resources.get_default_theme()):
@@ -106,13 +111,25 @@ class HtmlSongRenderer(song_renderer.SongRenderer):
                 #song_render += '<div class="line">'
                 
                 line_render = f'\n<div class="line" id="line-{i :d}">'
-                for instrument in line:
-                    instrument.set_index(instrument_index)
-                    #instrument_render = instrument.render_in_html(self.HTML_note_width)
-                    instrument_render = '\n'
-                    instrument_render += instrument_renderer.render(instrument)  
-                    instrument_index += 1
-                    line_render += instrument_render
+                
+                # Instruments already rendered at the same index are reused
+                fragment_key = (instrument_index, html_lines.get_line_key(line))
+                instruments_render = html_lines.get(fragment_key)
+                if instruments_render is None:
+                    instruments_render = ''
+                    for instrument in line:
+                        instrument.set_index(instrument_index)
+                        #instrument_render = instrument.render_in_html(self.HTML_note_width)
+                        instrument_render = '\n'
+                        instrument_render += instrument_renderer.render(instrument)  
+                        instrument_index += 1
+                        instruments_render += instrument_render
+                    html_lines.put(fragment_key, instruments_render)
+                else:
+                    for instrument in line:
+                        instrument.set_index(instrument_index)
+                        instrument_index += 1
+                line_render += instruments_render
                 
                 if num_lines > 10 and line[0].get_type() in instruments.HARPS:
                     line_render += f'\n<div class="num">{non_voice_row :d}</div>'
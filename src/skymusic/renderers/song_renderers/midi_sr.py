@@ -1,4 +1,4 @@
-import re, io
+import re, io, struct
 from . import song_renderer
 from skymusic import instruments
 from skymusic.renderers.instrument_renderers.midi_ir import MidiInstrumentRenderer
@@ -11,23 +11,37 @@ except (ImportError, ModuleNotFoundError):
     no_mido_module = True
 
 
+MIDI_STATUS = {'note_on': 0x90, 'note_off': 0x80, 'program_change': 0xC0} # On channel 0
+MIDI_TICKS_PER_BEAT = 480 # Same resolution as the files written by mido
+
+
+def encode_variable_int(value):
+    """Encodes a delta time or a length as a MIDI variable length integer"""
+    data = [value & 0x7F]
+    value >>= 7
+    while value:
+        data.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(data))
+
+
 class MidiSongRenderer(song_renderer.SongRenderer):
 
-    def __init__(self, locale=None, song_bpm=Resources.DEFAULT_BPM):
+    def __init__(self, locale=None, song_bpm=Resources.DEFAULT_BPM, use_mido=None):
         
         super().__init__(locale)
         
-        if not no_mido_module:
-            # CAUTION: instrument codes correspond to General Midi codes (see Wikipedia) minus 1
-            # An instrument will sound very strange if played outside its natural pitch range
-            midi_instruments = {'piano': 0, 'guitar': 24, 'flute': 73, 'pan': 75}
-            self.midi_note_duration = 0.55*Resources.DEFAULT_BPM/220  # note duration is 0.55 seconds for 220 bpm
-            if isinstance(song_bpm, (int, float)):
-                self.midi_bpm = song_bpm  # Beats per minute
-            else:
-                self.midi_bpm = Resources.DEFAULT_BPM
-            self.midi_instrument = midi_instruments['piano']
-            self.midi_key = None
+        # CAUTION: instrument codes correspond to General Midi codes (see Wikipedia) minus 1
+        # An instrument will sound very strange if played outside its natural pitch range
+        midi_instruments = {'piano': 0, 'guitar': 24, 'flute': 73, 'pan': 75}
+        self.midi_note_duration = 0.55*Resources.DEFAULT_BPM/220  # note duration is 0.55 seconds for 220 bpm
+        if isinstance(song_bpm, (int, float)):
+            self.midi_bpm = song_bpm  # Beats per minute
+        else:
+            self.midi_bpm = Resources.DEFAULT_BPM
+        self.midi_instrument = midi_instruments['piano']
+        self.midi_key = None
+        self.use_mido = use_mido if use_mido is not None else Resources.midi_use_mido # Otherwise, the file is written directly by __write_smf__
 
 
     def __write_header__(self, mid, track, tempo, instrument=None):
@@ -66,12 +80,12 @@ class MidiSongRenderer(song_renderer.SongRenderer):
         self.__write_header__(mid, track, tempo, instrument) 
         return track
 
-    def write_buffers(self, song):
+    def write_buffers(self, song, lines=None):
+        """lines is an optional iterable of lines of instruments, read instead of the lines of the song"""
         global no_mido_module
 
-        if no_mido_module:
-            print("\n***WARNING: MIDI was not created because mido module was not found.")
-            return None
+        if self.use_mido and no_mido_module:
+            print("\n***WARNING: mido module was not found. Using the built-in MIDI writer instead.")
     
         try:
             self.midi_key = re.sub(r'#', '#m', song.get_music_key())  # For mido sharped keys are minor
@@ -79,6 +93,19 @@ class MidiSongRenderer(song_renderer.SongRenderer):
             self.midi_key = Resources.DEFAULT_KEY
             print(f"\n***ERROR: Invalid music key passed to the MIDI renderer: using {self.midi_key} instead.")
 
+        song_lines = song.get_lines() if lines is None else lines
+        
+        if self.use_mido and not no_mido_module:
+            midi_buffer = self.__write_mido__(song, song_lines)
+        else:
+            midi_buffer = self.__write_smf__(song, song_lines)
+        
+        midi_buffer.seek(0)
+
+        return [midi_buffer]
+
+    def __write_mido__(self, song, song_lines):
+        """Writes the MIDI file by appending mido messages to mido tracks"""
         try:
             tempo = mido.bpm2tempo(self.midi_bpm)
         except ValueError:
@@ -93,7 +120,6 @@ class MidiSongRenderer(song_renderer.SongRenderer):
         note_ticks = self.midi_note_duration * sec * Resources.DEFAULT_BPM / self.midi_bpm  # note duration in ticks
         instrument_renderer = MidiInstrumentRenderer(self.locale, note_ticks=note_ticks, music_key=song.get_music_key())
         
-        song_lines = song.get_lines()
         for line in song_lines:
             if len(line) > 0:
                 linetype = line[0].get_type().lower().strip()
@@ -114,6 +140,116 @@ class MidiSongRenderer(song_renderer.SongRenderer):
         midi_buffer = io.BytesIO()
         mid.save(file=midi_buffer)
         
-        midi_buffer.seek(0)
+        return midi_buffer
 
-        return [midi_buffer]
+    def __write_smf__(self, song, song_lines):
+        """
+        Writes the bytes of a Standard MIDI File directly, with the same content as the file written by mido.
+        Songs repeat a small vocabulary of harps, so the events of each distinct harp are encoded once.
+        """
+        tempo = int(round(60 * 1e6 / self.midi_bpm)) # Microseconds per beat
+        if not 0 <= tempo <= 0xFFFFFF:
+            print(f"\n***ERROR: invalid tempo passed to MIDI renderer. Using {Resources.DEFAULT_BPM} bpm instead.")
+            tempo = int(round(60 * 1e6 / Resources.DEFAULT_BPM))
+        
+        tracks = [self.__smf_copyright_track__(song)]
+        (track, running_status) = self.__smf_new_track__(tempo, self.midi_instrument)
+        
+        sec = int(round(MIDI_TICKS_PER_BEAT / (tempo * 1e-6)))  # 1 second in ticks
+        note_ticks = self.midi_note_duration * sec * Resources.DEFAULT_BPM / self.midi_bpm  # note duration in ticks
+        instrument_renderer = MidiInstrumentRenderer(self.locale, note_ticks=note_ticks, music_key=song.get_music_key())
+        
+        encoded_harps = {} # (render key, skygrid intern key) -> encoded events
+        for line in song_lines:
+            if len(line) > 0:
+                linetype = line[0].get_type().lower().strip()
+                if linetype == 'layer':
+                    tracks.append(self.__smf_end_track__(track))
+                    (track, running_status) = self.__smf_new_track__(tempo)#no instrument change yet
+                elif linetype in instruments.HARPS:
+                    instrument_index = 0
+                    for instrument in line:
+                        instrument.set_index(instrument_index)
+                        render_key = (instrument.get_render_key(), instrument.skygrid.get_intern_key()) # Events follow the order in which notes were set
+                        try:
+                            encoded = encoded_harps[render_key]
+                        except KeyError:
+                            encoded = self.__smf_encode_events__(instrument_renderer.render_harp_events(instrument))
+                            encoded_harps[render_key] = encoded
+                        for i in range(0, instrument.get_repeat()):
+                            if encoded is not None:
+                                (first_status, events, running_events, last_status) = encoded
+                                track += running_events if first_status == running_status else events
+                                running_status = last_status
+                            instrument_index += 1
+        
+        tracks.append(self.__smf_end_track__(track))
+        
+        midi_buffer = io.BytesIO()
+        midi_buffer.write(b'MThd' + struct.pack('>L', 6) + struct.pack('>hhh', 1, len(tracks), MIDI_TICKS_PER_BEAT))
+        for track in tracks:
+            midi_buffer.write(b'MTrk' + struct.pack('>L', len(track)))
+            midi_buffer.write(track)
+        
+        return midi_buffer
+
+    def __smf_meta_event__(self, type_byte, data):
+        return b'\x00\xff' + bytes([type_byte]) + encode_variable_int(len(data)) + data
+
+    def __smf_new_track__(self, tempo, instrument=None):
+        """Returns the header events of a new track, and the running status after them"""
+        track = bytearray(self.__smf_meta_event__(0x51, struct.pack('>L', tempo)[1:]))
+        running_status = None
+        
+        try:
+            (sharps, minor) = Resources.MIDI_KEY_SIGNATURES[self.midi_key]
+            track += self.__smf_meta_event__(0x59, bytes([sharps & 0xFF, minor]))
+        except (KeyError, TypeError):
+            print(f"\n***ERROR: invalid key passed to MIDI renderer. Using {Resources.DEFAULT_KEY} instead.")
+            (sharps, minor) = Resources.MIDI_KEY_SIGNATURES[Resources.DEFAULT_KEY]
+            track += self.__smf_meta_event__(0x59, bytes([sharps & 0xFF, minor]))
+            
+            if instrument:
+                track += bytes([0, MIDI_STATUS['program_change'], instrument])
+                running_status = MIDI_STATUS['program_change']
+        
+        return (track, running_status)
+
+    def __smf_copyright_track__(self, song):
+        
+        song_meta = song.get_meta()
+        
+        artist = song_meta['artist']
+        if artist: artist = artist[1]
+        transcript = song_meta['transcript']
+        if transcript: transcript = transcript[1]
+        
+        return self.__smf_end_track__(bytearray(self.__smf_meta_event__(0x02, (artist+'/'+transcript).encode('latin1'))))
+
+    def __smf_end_track__(self, track):
+        return track + self.__smf_meta_event__(0x2F, b'')
+
+    def __smf_encode_events__(self, events):
+        """
+        Encodes the (event_type, pitch, velocity, delta_t) events of a harp.
+        Returns (first status, bytes, bytes when the first status is already running, last status), or None if there are no events.
+        Like mido, the status byte of an event is omitted when it is the same as the previous one (running status).
+        """
+        if not events:
+            return None
+        
+        encoded = bytearray()
+        running_status = None
+        for (event_type, pitch, velocity, delta_t) in events:
+            status = MIDI_STATUS[event_type]
+            encoded += encode_variable_int(delta_t)
+            if status != running_status:
+                encoded.append(status)
+            encoded += bytes([pitch, velocity])
+            running_status = status
+        
+        first_status = MIDI_STATUS[events[0][0]]
+        delta_length = len(encode_variable_int(events[0][3]))
+        running_encoded = encoded[:delta_length] + encoded[delta_length+1:]
+        
+        return (first_status, bytes(encoded), bytes(running_encoded), running_status)
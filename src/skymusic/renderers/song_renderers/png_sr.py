@@ -1,33 +1,55 @@
-import io
+import io, pickle, zlib
 import textwrap
+import concurrent.futures
 from . import song_renderer
 from skymusic import instruments, sheetlayout
+from skymusic.renderers.instrument_renderers import png_ir
 from skymusic.renderers.instrument_renderers.png_ir import PngInstrumentRenderer
+from skymusic.modes import ImageFormat
 from skymusic.resources import Resources
 
 
 try:
-    from PIL import Image, ImageDraw, ImageFont
+    from PIL import Image, ImageDraw, features
 
     no_PIL_module = False
 except (ImportError, ModuleNotFoundError):
     no_PIL_module = True
 
 
+def pack_line(line_render):
+    '''Compresses a drawn line to be cached: lines are mostly background, so they shrink about a hundred times'''
+    return (line_render.mode, line_render.size, zlib.compress(line_render.tobytes(), 1))
+
+def unpack_line(packed_line):
+    (mode, size, data) = packed_line
+    return Image.frombytes(mode, size, zlib.decompress(data))
+
+def get_packed_line_size(packed_line):
+    return len(packed_line[2])
+
+# Drawn lines, shared by all PNG renderers, compressed and bounded in bytes by Resources.png_line_cache_size
+png_lines = song_renderer.LineFragmentCache(max_size=0, get_size=get_packed_line_size)
+
 
 class PngSongRenderer(song_renderer.SongRenderer):
 
-    def __init__(self, locale=None, aspect_ratio=16/9.0, theme=Resources.get_default_theme()):
+    def __init__(self, locale=None, aspect_ratio=16/9.0, theme=Resources.get_default_theme(), num_workers=None, max_files=None, image_format=ImageFormat.PNG):
         
         super().__init__(locale)
         Resources.load_theme(theme)
+        self.theme = theme
+        
+        # Number of processes drawing pages at the same time
+        self.num_workers = num_workers if num_workers is not None else Resources.png_num_workers
+        png_lines.resize(Resources.png_line_cache_size)
         
         self.harp_AspectRatio = 1.455
         self.harp_relspacings = (0.13, 0.1)  # Fraction of the harp width that will be allocated to the spacing between harps
 
         self.aspect_ratio = aspect_ratio
         self.maxIconsPerLine = round(10*aspect_ratio/(16/9.0))
-        self.maxFiles = Resources.MAX_NUM_FILES
+        self.maxFiles = max_files if max_files is not None else Resources.MAX_NUM_FILES
 
         if not no_PIL_module:
             Resources.load_theme(theme)
@@ -39,6 +61,10 @@ class PngSongRenderer(song_renderer.SongRenderer):
             self.png_lyric_size = None
             self.png_dpi = (96 * 2, 96 * 2)
             self.png_compress = Resources.png_compress
+            self.image_format = image_format
+            if image_format == ImageFormat.WEBP and not features.check('webp'):
+                print("\n***WARNING: PIL was built without WebP support. Saving PNG instead.")
+                self.image_format = ImageFormat.PNG
             self.font_color = Resources.font_color
             self.png_color = Resources.png_color
             self.png_font_size = Resources.png_font_size
@@ -46,14 +72,9 @@ class PngSongRenderer(song_renderer.SongRenderer):
             self.png_h2_font_size = Resources.png_h2_font_size
             self.png_font_path = Resources.font_path
             
-            try:
-                self.h1_font = ImageFont.truetype(self.png_font_path, self.png_h1_font_size)
-                self.h2_font = ImageFont.truetype(self.png_font_path, self.png_h2_font_size)
-                self.text_font = ImageFont.truetype(self.png_font_path, self.png_font_size)
-            except OSError:
-                self.h1_font = ImageFont.load_default()
-                self.h2_font = ImageFont.load_default()
-                self.text_font = ImageFont.load_default()
+            self.h1_font = png_ir.fonts.get_font(self.png_font_path, self.png_h1_font_size)
+            self.h2_font = png_ir.fonts.get_font(self.png_font_path, self.png_h2_font_size)
+            self.text_font = png_ir.fonts.get_font(self.png_font_path, self.png_font_size)
                 
             self.switch_harp('harp')            
             
@@ -94,15 +115,25 @@ class PngSongRenderer(song_renderer.SongRenderer):
 
     def get_png_text_height(self, fnt):
         """Calculates the text height in PNG for a standard text depending on the input font size"""
-        return fnt.getsize('HQfgjyp')[1]
+        return png_ir.fonts.get_text_size(fnt, 'HQfgjyp')[1]
 
     def trans_paste(self, bg, fg, box=(0, 0)):
+            """Alpha-composites fg over bg at box, blending only the region covered by fg"""
             if fg.mode == 'RGBA':
                 if bg.mode != 'RGBA':
                     bg = bg.convert('RGBA')
-                fg_trans = Image.new('RGBA', bg.size)
-                fg_trans.paste(fg, box, mask=fg)  # transparent foreground
-                return Image.alpha_composite(bg, fg_trans)
+                (x, y) = box
+                # Clips the foreground to the background bounds
+                (x0, y0) = (max(0, x), max(0, y))
+                (x1, y1) = (min(bg.size[0], x + fg.size[0]), min(bg.size[1], y + fg.size[1]))
+                if x1 <= x0 or y1 <= y0:
+                    return bg
+                if (x0, y0, x1, y1) != (x, y, x + fg.size[0], y + fg.size[1]):
+                    fg = fg.crop((x0 - x, y0 - y, x1 - x, y1 - y))
+                fg_trans = Image.new('RGBA', fg.size)
+                fg_trans.paste(fg, mask=fg)  # transparent foreground
+                bg.paste(Image.alpha_composite(bg.crop((x0, y0, x1, y1)), fg_trans), (x0, y0))
+                return bg
             else:
                 if bg.mode == 'RGBA':
                     bg = bg.convert('RGB')
@@ -118,116 +149,115 @@ class PngSongRenderer(song_renderer.SongRenderer):
             splitted = textwrap.wrap(text, width=maxlen, break_long_words=True)
             return "\n".join(splitted), len(splitted)
 
-    def write_header(self, song_render, filenum, song, x_in_png, y_in_png):
-    
+    def layout_header(self, filenum, song, x_in_png, y_in_png):
+        """
+        Computes the position of the title and metadata texts, without drawing them.
+        Returns a list of (text, font name, text image size, position in png) tuples
+        """
         meta = song.get_meta()
         harp_rescale = self.get_png_harp_rescale()
         line_width = self.png_line_width
+        header = []
     
         if filenum == 0:
 
             title = meta['title'][1]
             fnt = self.h1_font
-            title, numlines = self.wrap_text(title, fnt.getsize(title)[0], int(line_width/harp_rescale))               
+            title, numlines = self.wrap_text(title, png_ir.fonts.get_text_size(fnt, title)[0], int(line_width/harp_rescale))               
             h = self.get_png_text_height(fnt)
-            title_header = Image.new('RGBA', (int(line_width/harp_rescale), int(h*numlines)))
-            draw = ImageDraw.Draw(title_header)
-            draw.text((0, 0), title, font=fnt, fill=self.font_color)
-            if harp_rescale != 1:
-                title_header = title_header.resize(
-                    (int(title_header.size[0] * harp_rescale), int(title_header.size[1] * harp_rescale)),
-                    resample=Image.LANCZOS)
-            song_render = self.trans_paste(song_render, title_header, (int(x_in_png), int(y_in_png)))
+            header.append((title, 'h1_font', (int(line_width/harp_rescale), int(h*numlines)), (int(x_in_png), int(y_in_png))))
             y_in_png += (h+1) * numlines * harp_rescale
 
             for k in meta:
                 if k != 'title':
                     meta_text = meta[k][0] + ' ' + meta[k][1]
-                    #fnt = ImageFont.truetype(self.png_font_path, self.)
                     fnt = self.text_font
-                    meta_text, numlines = self.wrap_text(meta_text, fnt.getsize(meta_text)[0], int(line_width/harp_rescale))
+                    meta_text, numlines = self.wrap_text(meta_text, png_ir.fonts.get_text_size(fnt, meta_text)[0], int(line_width/harp_rescale))
                     h = self.get_png_text_height(fnt)
-                    header = Image.new('RGBA', (int(line_width/harp_rescale), int(h*numlines)))
-                    draw = ImageDraw.Draw(header)
-                    draw.text((0, 0), meta_text, font=fnt, fill=self.font_color)
-                    if harp_rescale != 1:
-                        header = header.resize((int(header.size[0] * harp_rescale), int(header.size[1] * harp_rescale)),
-                                               resample=Image.LANCZOS)
-                    song_render = self.trans_paste(song_render, header, (int(x_in_png), int(y_in_png)))
+                    header.append((meta_text, 'text_font', (int(line_width/harp_rescale), int(h*numlines)), (int(x_in_png), int(y_in_png))))
                     y_in_png += (h+1) * numlines * harp_rescale
             
             y_in_png += h * harp_rescale
             
         else:
-            #fnt = ImageFont.truetype(self.png_font_path, self.png_font_size)
             fnt = self.text_font
             h = self.get_png_text_height(fnt)
-            title_header = Image.new('RGBA', (int(line_width), int(h)))
-            draw = ImageDraw.Draw(title_header)
-            draw.text((0, 0), f"{meta['title'][1]} (page {filenum+1 :d})", font=fnt, fill=self.font_color)
-            if harp_rescale != 1:
-                title_header = title_header.resize(
-                    (int(title_header.size[0] * harp_rescale), int(title_header.size[1] * harp_rescale)),
-                    resample=Image.LANCZOS)
-            song_render = self.trans_paste(song_render, title_header, (int(x_in_png), int(y_in_png)))
+            header.append((f"{meta['title'][1]} (page {filenum+1 :d})", 'text_font', (int(line_width), int(h)), (int(x_in_png), int(y_in_png))))
             y_in_png += h * harp_rescale + self.png_harp_spacings[1]    
     
-        return (song_render, x_in_png, y_in_png)
-    
+        return (header, x_in_png, y_in_png)
 
-    def write_buffers(self, song, start_row=0, start_col=0, buffer_list=None):
+    def write_header(self, song_render, header):
+        """Draws the texts positioned by layout_header"""
+        harp_rescale = self.get_png_harp_rescale()
         
-        if buffer_list is None:
-            buffer_list = []
-        global no_PIL_module
+        for (text, font_name, text_size, position) in header:
+            text_render = Image.new('RGBA', text_size)
+            draw = ImageDraw.Draw(text_render)
+            draw.text((0, 0), text, font=getattr(self, font_name), fill=self.font_color)
+            if harp_rescale != 1:
+                text_render = text_render.resize(
+                    (int(text_render.size[0] * harp_rescale), int(text_render.size[1] * harp_rescale)),
+                    resample=Image.LANCZOS)
+            song_render = self.trans_paste(song_render, text_render, position)
+    
+        return song_render
 
-        if no_PIL_module:
-            print("\n***WARNING: PNG was not rendered because PIL module was not found. ***")
-            return None
-     
-        filenum = len(buffer_list)
-        if len(buffer_list) >= self.maxFiles:
-            print(f"\n***WARNING: Your song is too long. Stopping at {self.maxFiles} files.")
-            return buffer_list
-        
-        harp_type = song.get_harp_type()
-        instrument_renderer = PngInstrumentRenderer(locale=self.locale, harp_type=harp_type)
+    def get_hr_line_width(self):
+        """Width of the horizontal ruler drawn between lines of harps"""
+        return max(1,int(4*self.get_png_harp_rescale()))
+
+    def get_hr_line(self):
+        """Horizontal ruler drawing, pasted between lines of harps"""
+        rulerH = self.get_hr_line_width()
+        hr_line = Image.new('RGBA', (int(self.png_line_width), 3*rulerH))
+        draw = ImageDraw.Draw(hr_line)
+        draw.line([(0, int(hr_line.size[1]/2)), (self.png_line_width, int(hr_line.size[1]/2))],
+                  fill=(150, 150, 150), width=rulerH)
+        return hr_line
+
+    def prepare_song(self, song):
+        """Sets the instrument renderer and the harp sizes for this song"""
+        self.prepare_harps(song.get_harp_type(), song.get_max_instruments_per_line())
+
+    def prepare_harps(self, harp_type, max_instruments_per_line):
+        """Sets the instrument renderer and the harp sizes, from the only properties of the song they depend on"""
+        self.instrument_renderer = PngInstrumentRenderer(locale=self.locale, harp_type=harp_type)
         self.switch_harp(harp_type)
         
         # Determines png size as a function of the numer of icons per line
-        self.set_png_harp_size(song.get_max_instruments_per_line())
+        self.set_png_harp_size(max_instruments_per_line)
         self.set_png_voice_size()
+
+    def layout_page(self, song, filenum, start_row=0, start_col=0):
+        """
+        Computes the positions of everything drawn on page #filenum, starting at instrument (start_row, start_col), without drawing anything.
+        Returns a dictionary with the header texts, the ordered list of drawing operations, and the next page start
+        Operations are either ('ruler', position) or ('line', position, size, [(row, col, position, repeat position or None), ...])
+        """
+        instrument_renderer = self.instrument_renderer
         
         text_font_height = self.get_png_text_height(self.text_font)
         h1_font_height = self.get_png_text_height(self.h1_font)
         h2_font_height = self.get_png_text_height(self.h2_font)
         
         harp_rescale = self.get_png_harp_rescale()
-        song_render = Image.new('RGBA', self.png_size, self.png_color)
-
-        # Horizontal ruler drawing, to be used several times later
-        rulerH = max(1,int(4*harp_rescale))
-        hr_line = Image.new('RGBA', (int(self.png_line_width), 3*rulerH))
-        draw = ImageDraw.Draw(hr_line)
-        draw = draw.line(
-                        [(0, int(hr_line.size[1]/2)), (self.png_line_width, int(hr_line.size[1]/2))],
-                        fill=(150, 150, 150),
-                        width=rulerH)
+        hr_line_height = 3*self.get_hr_line_width()
 
         x_in_png = int(self.png_margins[0])
         y_in_png = int(self.png_margins[0])
         
-        (song_render, x_in_png, y_in_png) = self.write_header(song_render, filenum, song, x_in_png, y_in_png)
+        (header, x_in_png, y_in_png) = self.layout_header(filenum, song, x_in_png, y_in_png)
 
+        operations = []
         ysong = y_in_png
-        instrument_index = 0
         num_lines = song.get_num_lines()
         end_row = num_lines
         end_col = 0
         ncols = self.maxIconsPerLine
         page_break = False
         
-        # Creating a new song image, located at x_in_song, yline_in_song
+        # Each line is located at x_in_song, yline_in_song
         xline_in_song = x_in_png
         yline_in_song = ysong
         prev_line = ''
@@ -254,8 +284,8 @@ class PngSongRenderer(song_renderer.SongRenderer):
                 # Forced dividing line after each line of harps
                 if prev_line not in ('ruler', 'layer'):
                     yline_in_song += self.png_harp_spacings[1] / 4.0
-                    song_render.paste(hr_line, (int(xline_in_song), int(yline_in_song)))
-                    yline_in_song += hr_line.size[1] + self.png_harp_spacings[1] / 2.0
+                    operations.append(('ruler', (int(xline_in_song), int(yline_in_song))))
+                    yline_in_song += hr_line_height + self.png_harp_spacings[1] / 2.0
             else:
                 raise TypeError("Unkown linetype type: "+linetype)
 
@@ -269,39 +299,35 @@ class PngSongRenderer(song_renderer.SongRenderer):
                     else:
                         line_height += int(text_font_height) 
 
-            # Line image
-            line_render = Image.new('RGBA', (line_width, line_height), self.png_color)
-
-            # Pasting instrument images, starting at x=0 (in line) and y=0 (in line)           
+            # Line image, with instruments starting at x=0 (in line) and y=0 (in line)           
+            line_instruments = []
             sub_line = 0
             x = 0
             y = 0
             for col in range(start_col, end_col):
 
                 instrument = song.get_instrument(row, col)
-                instrument.set_index(instrument_index)
                 
                 # Creating a new line if max number is exceeded
                 if x + self.png_harp_size[0] + self.png_harp_spacings[0] / 2.0 > line_width:
                     x = 0
-                    song_render = self.trans_paste(song_render, line_render, (int(xline_in_song), int(yline_in_song)))
-                    yline_in_song += line_render.size[1] + self.png_harp_spacings[1] / 2.0
+                    operations.append(('line', (int(xline_in_song), int(yline_in_song)), (line_width, line_height), line_instruments))
+                    yline_in_song += line_height + self.png_harp_spacings[1] / 2.0
                     if linetype in instruments.HARPS: yline_in_song += self.png_harp_spacings[1] / 2.0
 
                     sub_line += 1
 
                     # New line
-                    line_render = Image.new('RGBA', (line_width, line_height), self.png_color)
+                    line_instruments = []
                     
-                #NEW
                 ypredict = yline_in_song +  self.png_harp_spacings[1]
                 
                 if linetype in instruments.TEXT:
                     ypredict += self.png_lyric_size[1]
                 elif linetype == 'ruler':
-                    ypredict += hr_line.size[1]
+                    ypredict += hr_line_height
                 elif linetype == 'layer':
-                    ypredict += hr_line.size[1]
+                    ypredict += hr_line_height
                 elif linetype in instruments.HARPS:
                     ypredict += self.png_harp_size[1]
                 else:
@@ -312,27 +338,25 @@ class PngSongRenderer(song_renderer.SongRenderer):
                     end_col = col
                     break
 
-                # INSTRUMENT RENDER
-                instrument_render = instrument_renderer.render(instrument, harp_rescale, max_size=(line_width,line_height))
-                # should add a special case for horizontal ruler
-                line_render = self.trans_paste(line_render, instrument_render, (int(x), int(y)))
-
-                x += max(self.png_harp_size[0], instrument_render.size[0])
+                # INSTRUMENT
+                instrument_position = (int(x), int(y))
+                instrument_size = instrument_renderer.get_render_size(instrument, harp_rescale, max_size=(line_width,line_height))
+                x += max(self.png_harp_size[0], instrument_size[0])
 
                 # REPEAT
                 if instrument.get_repeat() > 1:
-                    repeat_im = instrument_renderer.get_repeat_png(instrument, self.png_harp_spacings[0], harp_rescale)
-                    line_render = self.trans_paste(line_render, repeat_im,
-                                              (int(x), int(y + self.png_harp_size[1] - repeat_im.size[1])))
-                    x += max(repeat_im.size[0], self.png_harp_spacings[0])
+                    repeat_size = instrument_renderer.get_repeat_size(self.png_harp_spacings[0], harp_rescale)
+                    repeat_position = (int(x), int(y + self.png_harp_size[1] - repeat_size[1]))
+                    x += max(repeat_size[0], self.png_harp_spacings[0])
                 else:
+                    repeat_position = None
                     x += self.png_harp_spacings[0]
 
-                instrument_index += 1
+                line_instruments.append((row, col, instrument_position, repeat_position))
 
             #end loop on cols: pasting line
-            song_render = self.trans_paste(song_render, line_render,(int(xline_in_song), int(yline_in_song)))
-            yline_in_song += line_render.size[1] + self.png_harp_spacings[1] / 2.0
+            operations.append(('line', (int(xline_in_song), int(yline_in_song)), (line_width, line_height), line_instruments))
+            yline_in_song += line_height + self.png_harp_spacings[1] / 2.0
             if linetype in instruments.HARPS:
                 yline_in_song += self.png_harp_spacings[1] / 2.0
 
@@ -342,15 +366,178 @@ class PngSongRenderer(song_renderer.SongRenderer):
                 break
 
         #End loop on rows
-        song_buffer = io.BytesIO()
-        song_render.save(song_buffer, format='PNG', dpi=self.png_dpi, compress_level=self.png_compress)
+        if end_row < song.get_num_lines() or 0 < end_col < ncols:
+            next_start = (end_row, end_col)
+        else:
+            next_start = None
+
+        return {'filenum': filenum, 'header': header, 'operations': operations, 'next_start': next_start}
 
+    def iter_layouts(self, song):
+        """Splits the song into pages, and yields the layout of each page in turn"""
+        next_start = (0, 0)
+        filenum = 0
+        
+        while next_start is not None:
+            if filenum >= self.maxFiles:
+                print(f"\n***WARNING: Your song is too long. Stopping at {self.maxFiles} files.")
+                break
+            page = self.layout_page(song, filenum, *next_start)
+            yield page
+            next_start = page['next_start']
+            filenum += 1
+
+    def layout_pages(self, song):
+        """Splits the song into pages, and computes the layout of each page"""
+        return list(self.iter_layouts(song))
+
+    def get_palette_image(self, song_render):
+        """
+        Reduces a page to an 8-bit palette image. This is lossy: anti-aliased pages have thousands of colours,
+        which are snapped to the nearest of 256 colours picked for the page, without dithering to keep flat areas flat
+        """
+        return song_render.quantize(colors=256, method=Image.FASTOCTREE, dither=Image.NONE)
+
+    def save_page(self, song_render):
+        """Encodes a page in the image format of this renderer, and returns it as a bytes buffer"""
+        song_buffer = io.BytesIO()
+        
+        if self.image_format == ImageFormat.WEBP:
+            song_render.save(song_buffer, format='WEBP', lossless=True, exact=True,
+                             quality=Resources.webp_effort, method=Resources.webp_method)
+        elif self.image_format == ImageFormat.PALETTE_PNG:
+            self.get_palette_image(song_render).save(song_buffer, format='PNG', dpi=self.png_dpi, compress_level=self.png_compress)
+        else:
+            song_render.save(song_buffer, format='PNG', dpi=self.png_dpi, compress_level=self.png_compress)
+        
         song_buffer.seek(0)
-        buffer_list.append(song_buffer)
+        
+        return song_buffer
+
+    def get_page_instruments(self, song, page):
+        """Returns the instruments drawn on a page, keyed by (row, col), which is all render_page needs from the song"""
+        return {(row, col): song.get_instrument(row, col)
+                for operation in page['operations'] if operation[0] == 'line'
+                for (row, col, _, _) in operation[3]}
+
+    def render_page(self, page, instruments):
+        """
+        Draws a page whose layout was computed by layout_page, and returns it as a PNG buffer
+        instruments maps the (row, col) of each instrument of the page to the instrument, as returned by get_page_instruments
+        """
+        instrument_renderer = self.instrument_renderer
+        harp_rescale = self.get_png_harp_rescale()
+        
+        song_render = Image.new('RGBA', self.png_size, self.png_color)
+        hr_line = self.get_hr_line()
+        
+        song_render = self.write_header(song_render, page['header'])
+        
+        instrument_index = 0
+        for operation in page['operations']:
+            
+            if operation[0] == 'ruler':
+                song_render.paste(hr_line, operation[1])
+                continue
+            
+            (_, line_position, line_size, line_instruments) = operation
+            
+            # Lines drawn with the same instruments at the same places are reused
+            fragment_key = (Resources.loaded_theme, instrument_renderer.harp_type, self.png_harp_size, harp_rescale, line_size,
+                            tuple((instruments[(row, col)].get_render_key(), instrument_position, repeat_position)
+                                  for (row, col, instrument_position, repeat_position) in line_instruments))
+            packed_line = png_lines.get(fragment_key)
+            if packed_line is None:
+                line_render = Image.new('RGBA', line_size, self.png_color)
+                
+                for (row, col, instrument_position, repeat_position) in line_instruments:
+                    
+                    instrument = instruments[(row, col)]
+                    instrument.set_index(instrument_index)
+                    
+                    # INSTRUMENT RENDER
+                    instrument_render = instrument_renderer.render(instrument, harp_rescale, max_size=line_size)
+                    line_render = self.trans_paste(line_render, instrument_render, instrument_position)
 
+                    # REPEAT
+                    if repeat_position is not None:
+                        repeat_im = instrument_renderer.get_repeat_png(instrument, self.png_harp_spacings[0], harp_rescale)
+                        line_render = self.trans_paste(line_render, repeat_im, repeat_position)
 
-        # Open new file
-        if end_row < song.get_num_lines() or 0 < end_col < ncols:
-            buffer_list = self.write_buffers(song, end_row, end_col, buffer_list)
+                    instrument_index += 1
+                
+                png_lines.put(fragment_key, pack_line(line_render))
+            else:
+                line_render = unpack_line(packed_line)
+                for (row, col, _, _) in line_instruments:
+                    instruments[(row, col)].set_index(instrument_index)
+                    instrument_index += 1
+            
+            song_render = self.trans_paste(song_render, line_render, line_position)
+
+        return self.save_page(song_render)
+
+    def iter_pages_in_pool(self, song, pages):
+        """
+        Draws the pages concurrently in worker processes, and yields the buffers in page order
+        Each worker is sent its page and the instruments drawn on it, instead of the whole song
+        """
+        initargs = (self.locale, self.aspect_ratio, self.theme, self.image_format, song.get_harp_type(), song.get_max_instruments_per_line())
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(self.num_workers, len(pages)),
+                                                    initializer=_init_page_worker, initargs=initargs) as executor:
+            tasks = ((page, self.get_page_instruments(song, page)) for page in pages)
+            for png_bytes in executor.map(_render_page_in_worker, tasks):
+                yield io.BytesIO(png_bytes)
+
+    def iter_buffers(self, song):
+        """
+        Yields the PNG buffers one page at a time, so that they can be saved or sent as soon as they are drawn
+        """
+        global no_PIL_module
+
+        if no_PIL_module:
+            print("\n***WARNING: PNG was not rendered because PIL module was not found. ***")
+            return
+        
+        self.prepare_song(song)
+        
+        if self.num_workers <= 1:
+            for page in self.iter_layouts(song):
+                yield self.render_page(page, self.get_page_instruments(song, page))
+            return
+        
+        pages = self.layout_pages(song)
+        num_done = 0
+        # Starting the worker processes takes longer than drawing a few pages
+        if len(pages) >= Resources.png_pool_min_pages:
+            try:
+                for song_buffer in self.iter_pages_in_pool(song, pages):
+                    yield song_buffer
+                    num_done += 1
+            except (OSError, RuntimeError, pickle.PicklingError) as err:
+                print(f"\n***WARNING: Could not render PNG pages in parallel ({err}). Rendering them one by one.")
+        
+        for page in pages[num_done:]:
+            yield self.render_page(page, self.get_page_instruments(song, page))
+
+    def write_buffers(self, song):
+        
+        if no_PIL_module:
+            print("\n***WARNING: PNG was not rendered because PIL module was not found. ***")
+            return None
+        
+        return list(self.iter_buffers(song))
+
+
+# Process-wide state of the worker processes rendering pages in parallel
+_worker_renderer = None
+
+def _init_page_worker(locale, aspect_ratio, theme, image_format, harp_type, max_instruments_per_line):
+    global _worker_renderer
+    
+    _worker_renderer = PngSongRenderer(locale=locale, aspect_ratio=aspect_ratio, theme=theme, image_format=image_format)
+    _worker_renderer.prepare_harps(harp_type, max_instruments_per_line)
 
-        return buffer_list
+def _render_page_in_worker(task):
+    (page, instruments) = task
+    return _worker_renderer.render_page(page, instruments).getvalue()
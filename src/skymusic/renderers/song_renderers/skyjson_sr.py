@@ -14,8 +14,8 @@ class SkyjsonSongRenderer(song_renderer.SongRenderer):
         else:
             self.song_bpm = Resources.DEFAULT_BPM
 
-    def write_buffers(self, song):
-
+    def write_buffers(self, song, lines=None):
+        """lines is an optional iterable of lines of instruments, read instead of the lines of the song"""
         meta = song.get_meta()
 
         json_buffer = io.StringIO()
@@ -33,7 +33,7 @@ class SkyjsonSongRenderer(song_renderer.SongRenderer):
                      'isEncrypted': False, 
                      'instruments': []}
         
-        layers = self.build_layers(song.get_lines())
+        layers = self.build_layers(song.get_lines() if lines is None else lines)
         # { 6:{'name':'Layer 9', 'instruments':[<skymusic.instruments.Harp object at 0x114682278>,....}, {7:{...} }
         
         instruments = [{'name': layers[layer]['name'], 'volume':100,'pitch':'','visible':True} for layer in layers]
@@ -1,5 +1,6 @@
 import re, os, io
 from skymusic import Lang
+from skymusic.cache import LRUCache
 
 class SongRendererError(Exception):
     def __init__(self, explanation):
@@ -11,6 +12,19 @@ class SongRendererError(Exception):
     pass
 
 
+class LineFragmentCache(LRUCache):
+    """
+    A least-recently-used cache of rendered song lines, keyed by the position of the line and the render keys of its instruments.
+    After a small edit of a song, only the lines that changed are rendered again, and the others are taken from the cache.
+    """
+    def __init__(self, max_size=2048, get_size=None):
+        super().__init__(max_size, get_size)
+
+    def get_line_key(self, line):
+        '''Returns a hashable key describing the contents of a line of instruments'''
+        return tuple(instrument.get_render_key() for instrument in line)
+
+
 class SongRenderer():
     
     def __init__(self, locale=None):
@@ -6,9 +6,13 @@ from skymusic.modes import CSSMode
 from skymusic.resources import Resources
 
 
+# Rendered lines, shared by all SVG renderers
+svg_lines = song_renderer.LineFragmentCache()
+
+
 class SvgSongRenderer(song_renderer.SongRenderer):
 
-    def __init__(self, locale=None, aspect_ratio=16/9.0, theme=Resources.get_default_theme()):
+    def __init__(self, locale=None, aspect_ratio=16/9.0, theme=Resources.get_default_theme(), max_files=None, use_symbols=None):
         
         super().__init__(locale)
         Resources.load_theme(theme)
@@ -26,7 +30,10 @@ class SvgSongRenderer(song_renderer.SongRenderer):
         self.SVG_text_height = self.fontpt * self.pt2px  # In principle this should be in em
         self.SVG_rule_height = self.fontpt * self.pt2px*0.15
         self.SVG_layer_height = self.fontpt * self.pt2px
-        self.maxFiles = Resources.MAX_NUM_FILES
+        self.maxFiles = max_files if max_files is not None else Resources.MAX_NUM_FILES
+        
+        # Whether each distinct harp is drawn once in a <symbol>, and referenced by a <use> everywhere it appears
+        self.use_symbols = use_symbols if use_symbols is not None else Resources.svg_use_symbols
         
         self.harp_relspacings = (0.13, 0.1)# Fraction of the harp width that will be allocated to the spacing between harps
         
@@ -92,43 +99,153 @@ class SvgSongRenderer(song_renderer.SongRenderer):
         svg_buffer.write(f"\n<title>{meta['title'][1]}-{filenum}</title>")        
 
 
-    def write_buffers(self, song, css_mode=CSSMode.EMBED, start_row=0, start_col=0, buffer_list=None):
-
-        if buffer_list is None:
-            buffer_list = []
-        if len(buffer_list) >= self.maxFiles:
-            print(f"\n***WARNING: Your song is too long. Stopping at {self.maxFiles} files.")
-            return buffer_list
-
-        instrument_renderer = SvgInstrumentRenderer(self.locale)
+    def iter_buffers(self, song, css_mode=CSSMode.EMBED, svg_files=None):
+        """
+        Yields the SVG buffers one page at a time, so that they can be saved or sent as soon as they are written
+        If svg_files, an iterable of text file objects, is given, each page is written straight into the next file object, which is yielded instead of a buffer
+        When there are more pages than file objects, the remaining pages are written into new StringIO buffers
+        """
+        instrument_renderer = SvgInstrumentRenderer(self.locale, use_symbols=self.use_symbols)
         self.set_harp_AspectRatio(song.get_harp_aspect_ratio(), self.harp_relAspectRatio)
         #self.set_harp_AspectRatio(1.455)
+        
+        if svg_files is not None:
+            svg_files = iter(svg_files)
+        
+        next_start = (0, 0)
+        filenum = 0
+        
+        while next_start is not None:
+            if filenum >= self.maxFiles:
+                print(f"\n***WARNING: Your song is too long. Stopping at {self.maxFiles} files.")
+                break
+            svg_buffer = next(svg_files, None) if svg_files is not None else None
+            (svg_buffer, next_start) = self.write_page(song, css_mode, instrument_renderer, filenum, *next_start, svg_buffer=svg_buffer)
+            yield svg_buffer
+            filenum += 1
+
+
+    def write_buffers(self, song, css_mode=CSSMode.EMBED):
+        
+        return list(self.iter_buffers(song, css_mode))
+
+
+    def write_files(self, song, svg_files, css_mode=CSSMode.EMBED):
+        """
+        Writes the pages straight into svg_files, an iterable of text file objects opened for writing, one per page
+        Returns the list of file objects that were written, followed by StringIO buffers for the pages that did not fit in svg_files
+        """
+        return list(self.iter_buffers(song, css_mode, svg_files))
+
+
+    def write_line(self, line, row, start_col, y, ysong, instrument_index, instrument_renderer):
+        """
+        Writes the instruments of a line, starting at column start_col, until the end of the line or the end of the page
+        Returns the SVG text, the x and y positions after the line, the next instrument index, the column where the line stopped, whether the page is full,
+        and the harp symbols used in the line
+        """
+        linetype = line[0].get_type().lower().strip()
+        line_render = []
+        sub_line = 0
+        end_col = len(line)
+        page_break = False
+        symbols = {}
+        x = 0
+
+        for col in range(start_col, end_col):
+
+            instrument = line[col]
+            instrument.set_index(instrument_index)
+
+            #1. Creating a new line if max number is exceeded
+            if (int(1.0 * (col-start_col) / self.maxIconsPerLine) - sub_line) > 0:
+                # Closes previous instrument-line SVG
+                line_render.append('\n</svg>')
+                sub_line += 1
+                x = 0
+
+                # Creating a new line SVG
+                if linetype in instruments.TEXT:
+                    line_render.append(f'\n<svg x="{x :.2f}" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{self.SVG_text_height :.2f}"'
+                                       f' class="line-{row}-{sub_line}">')
+                    y += self.SVG_text_height + self.SVG_harp_spacings[1] / 2.0
+
+                elif linetype == 'ruler':
+                    line_render.append(f'\n<svg x="{x :.2f}" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{3*self.SVG_rule_height :.2f}"'
+                                       f' class="line-{row}-{sub_line}">')
+                    y += 3*self.SVG_rule_height + self.SVG_harp_spacings[1] / 2.0
+
+                elif linetype == 'layer':
+                    line_render.append(f'\n<svg x="{x :.2f}" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{3*self.SVG_layer_height :.2f}"'
+                                       f' class="line-{row}-{sub_line}">')
+                    y += 3*self.SVG_layer_height + self.SVG_harp_spacings[1] / 2.0
+
+                else:
+                    y += self.SVG_harp_spacings[1] / 2.0
+                    line_render.append(f'\n<svg x="{x :.2f}" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{self.SVG_harp_size[1] :.2f}"'
+                                       f' class="line-{row}-{sub_line}">')
+                    y += self.SVG_harp_size[1] + self.SVG_harp_spacings[1] / 2.0
+
+            #2. Page break
+            ypredict = y + ysong
+
+            if ypredict > (self.SVG_viewPort[3] - self.SVG_viewPortMargins[1]):
+                page_break = True
+                end_col = col
+                break
+
+            #3. INSTRUMENT RENDER
+            instrument_render = instrument_renderer.render(instrument, x, f"{(100.0 * self.SVG_harp_size[0] / self.SVG_line_width) :.2f}%", "100%", self.harp_AspectRatio)
+
+            #4. Repeat number
+            if instrument.get_repeat() > 1:
 
-        svg_buffer = io.StringIO()
-        filenum = len(buffer_list)
+                instrument_render += (f'\n<svg x="{(x + self.SVG_harp_size[0]) :.2f}" y="0%"'
+                                      f' width="{(100.0 * self.SVG_harp_size[0] / self.SVG_line_width) :.2f}%" height="100%">'
+                                     )
+                instrument_render += f'\n<text x="2%" y="98%" class="repeat">x{instrument.get_repeat()} </text></svg>'
+
+                x += self.SVG_harp_spacings[0]
+
+            line_render.append("\n" + instrument_render)
+            if self.use_symbols and instrument.get_type() in instruments.HARPS:
+                (symbol_id, symbol_content) = instrument_renderer.get_harp_symbol(instrument)
+                symbols[symbol_id] = symbol_content
+            instrument_index += 1
+            x += self.SVG_harp_size[0] + self.SVG_harp_spacings[0]
+
+        return (''.join(line_render), x, y, instrument_index, end_col, page_break, symbols)
+
+
+    def write_page(self, song, css_mode, instrument_renderer, filenum, start_row=0, start_col=0, svg_buffer=None):
+        """
+        Writes page #filenum, starting at instrument (start_row, start_col), into svg_buffer, a new StringIO by default or any text file object
+        Returns the SVG buffer and the (row, col) where the next page starts, or None if the song is complete
+        """
+        if svg_buffer is None:
+            svg_buffer = io.StringIO()
         meta = song.get_meta()
 
         # Open file SVG and write standard SVG headers
         self.write_headers(svg_buffer, filenum, song, css_mode)             
        
         # Song metadata SVG container
-        song_header = (f'\n<svg x="{self.SVG_viewPortMargins[0] :.2f}" y="{self.SVG_viewPortMargins[1] :.2f}"'
-                       f' width="{self.SVG_line_width :.2f}" height="{(self.SVG_viewPort[3] - self.SVG_viewPortMargins[1]) :.2f}">'
-                       )
+        svg_buffer.write(f'\n<svg x="{self.SVG_viewPortMargins[0] :.2f}" y="{self.SVG_viewPortMargins[1] :.2f}"'
+                         f' width="{self.SVG_line_width :.2f}" height="{(self.SVG_viewPort[3] - self.SVG_viewPortMargins[1]) :.2f}">')
 
         x = 0
         y = self.SVG_text_height  # Because the origin of text elements of the bottom-left corner
 
         if filenum == 0:
-            song_header += f"\n<text x=\"{x :.2f}\" y=\"{y :.2f}\" class=\"title\">{meta['title'][1]}</text>"           
+            svg_buffer.write(f"\n<text x=\"{x :.2f}\" y=\"{y :.2f}\" class=\"title\">{meta['title'][1]}</text>")
             
             for k in meta:
                 if k != 'title':
                     y += 2 * self.SVG_text_height
-                    song_header += f'\n<text x="{x :.2f}" y="{y :.2f}" class="headers">{meta[k][0]} {meta[k][1]}</text>'
+                    svg_buffer.write(f'\n<text x="{x :.2f}" y="{y :.2f}" class="headers">{meta[k][0]} {meta[k][1]}</text>')
                     
         else:
-            song_header += f"\n<text x=\"{x :.2f}\" y=\"{y :.2f}\" class=\"title\">{meta['title'][1]} (page {(filenum + 1)})</text>"
+            svg_buffer.write(f"\n<text x=\"{x :.2f}\" y=\"{y :.2f}\" class=\"title\">{meta['title'][1]} (page {(filenum + 1)})</text>")
         
         # Dividing line after title
         y += self.SVG_text_height
@@ -138,22 +255,19 @@ class SvgSongRenderer(song_renderer.SongRenderer):
             line = song.get_line(start_row)
             linetype = line[0].get_type().lower().strip()
             if linetype not in ('layer', 'ruler'):
-                song_header += (f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{(self.SVG_harp_spacings[1] / 2.0) :.2f}">'
-                                f'\n<line x1="0" y1="50%" x2="100%" y2="50%" class="sep" /> '
-                                f'\n</svg>')
+                svg_buffer.write(f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{(self.SVG_harp_spacings[1] / 2.0) :.2f}">'
+                                 f'\n<line x1="0" y1="50%" x2="100%" y2="50%" class="sep" /> '
+                                 f'\n</svg>')
                 
         y += self.SVG_text_height
 
-        song_header += '\n</svg>'
-
-        svg_buffer.write(song_header)
+        svg_buffer.write('\n</svg>')
 
         # Song SVG container
         ysong = y
 
-        song_render = (f'\n<svg x="{self.SVG_viewPortMargins[0] :.2f}" y="{y :.2f}"'
-                       f' width="{self.SVG_line_width :.2f}" height="{(self.SVG_viewPort[3] - y) :.2f}" class="song">'
-                      )
+        svg_buffer.write(f'\n<svg x="{self.SVG_viewPortMargins[0] :.2f}" y="{y :.2f}"'
+                         f' width="{self.SVG_line_width :.2f}" height="{(self.SVG_viewPort[3] - y) :.2f}" class="song">')
         y = 0  # Because we are nested in a new SVG
         x = 0
         instrument_index = 0
@@ -163,6 +277,7 @@ class SvgSongRenderer(song_renderer.SongRenderer):
         ncols = self.maxIconsPerLine
         page_break = False
         
+        page_symbols = {}
         non_voice_row = 1
         prev_line = 'ruler' #Because headers have been separated with a ruler (see above)
         for row in range(start_row, end_row):
@@ -177,112 +292,61 @@ class SvgSongRenderer(song_renderer.SongRenderer):
             # Line SVG container
             if linetype in instruments.TEXT:
                 
-                song_render += (f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{self.SVG_text_height :.2f}"'
-                                f' class="line" id="line-{row}">')
+                svg_buffer.write(f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{self.SVG_text_height :.2f}"'
+                                 f' class="line" id="line-{row}">')
                 y += self.SVG_text_height + self.SVG_harp_spacings[1] / 2.0
                 
             elif linetype == 'ruler':
-                song_render += (f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{3*self.SVG_rule_height :.2f}"'
-                                f' class="line" id="line-{row}">')
+                svg_buffer.write(f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{3*self.SVG_rule_height :.2f}"'
+                                 f' class="line" id="line-{row}">')
                 y += 3*self.SVG_rule_height + self.SVG_harp_spacings[1] / 2.0
 
             elif linetype == 'layer':
-                song_render += (f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{3*self.SVG_layer_height :.2f}"'
-                                f' class="line" id="line-{row}">')
+                svg_buffer.write(f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{3*self.SVG_layer_height :.2f}"'
+                                 f' class="line" id="line-{row}">')
                 y += 3*self.SVG_layer_height + self.SVG_harp_spacings[1] / 2.0
                 
             else:
                 if prev_line not in ('ruler', 'layer'):
                     # Dividing line
                     y += self.SVG_harp_spacings[1] / 4.0
-                    song_render += (f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{(self.SVG_harp_spacings[1] / 2.0) :.2f}">'
-                                    f'\n<line x1="0" y1="50%" x2="100%" y2="50%" class="sep"/>'
-                                    f'\n</svg>')
+                    svg_buffer.write(f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{(self.SVG_harp_spacings[1] / 2.0) :.2f}">'
+                                     f'\n<line x1="0" y1="50%" x2="100%" y2="50%" class="sep"/>'
+                                     f'\n</svg>')
                     y += self.SVG_harp_spacings[1] / 4.0
 
 
                 y += self.SVG_harp_spacings[1] / 2.0
                 # Instrument-line opening
-                song_render += (f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{self.SVG_harp_size[1] :.2f}"'
-                                f' class="line" id="line-{row}">')
+                svg_buffer.write(f'\n<svg x="0" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{self.SVG_harp_size[1] :.2f}"'
+                                 f' class="line" id="line-{row}">')
                 y += self.SVG_harp_size[1] + self.SVG_harp_spacings[1] / 2.0
 
-            line_render = ''
-            sub_line = 0
-            x = 0
-            
-            for col in range(start_col, end_col):
-
-                instrument = song.get_instrument(row, col)
-                instrument.set_index(instrument_index)
-
-                #1. Creating a new line if max number is exceeded
-                if (int(1.0 * (col-start_col) / self.maxIconsPerLine) - sub_line) > 0:
-                    # Closes previous instrument-line SVG
-                    line_render += '\n</svg>'
-                    sub_line += 1
-                    x = 0
-
-                    # Creating a new line SVG
-                    if linetype in instruments.TEXT:
-                        line_render += (f'\n<svg x="{x :.2f}" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{self.SVG_text_height :.2f}"'
-                                        f' class="line-{row}-{sub_line}">')
-                        y += self.SVG_text_height + self.SVG_harp_spacings[1] / 2.0
-                        
-                    elif linetype == 'ruler':
-                        line_render += (f'\n<svg x="{x :.2f}" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{3*self.SVG_rule_height :.2f}"'
-                                        f' class="line-{row}-{sub_line}">')
-                        y += 3*self.SVG_rule_height + self.SVG_harp_spacings[1] / 2.0
-
-                    elif linetype == 'layer':
-                        line_render += (f'\n<svg x="{x :.2f}" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{3*self.SVG_layer_height :.2f}"'
-                                        f' class="line-{row}-{sub_line}">')
-                        y += 3*self.SVG_layer_height + self.SVG_harp_spacings[1] / 2.0
-                        
-                    else:
-                        y += self.SVG_harp_spacings[1] / 2.0
-                        line_render += (f'\n<svg x="{x :.2f}" y="{y :.2f}" width="{self.SVG_line_width :.2f}" height="{self.SVG_harp_size[1] :.2f}"'
-                                        f' class="line-{row}-{sub_line}">')
-                        y += self.SVG_harp_size[1] + self.SVG_harp_spacings[1] / 2.0
-
-                #2. Page break
-                ypredict = y + ysong
-                
-                if ypredict > (self.SVG_viewPort[3] - self.SVG_viewPortMargins[1]):
-                    page_break = True
-                    end_col = col
-                    break
-
-                #3. INSTRUMENT RENDER
-                instrument_render = instrument_renderer.render(instrument, x, f"{(100.0 * self.SVG_harp_size[0] / self.SVG_line_width) :.2f}%", "100%", self.harp_AspectRatio)
-
-                #4. Repeat number
-                if instrument.get_repeat() > 1:
-
-                    instrument_render += (f'\n<svg x="{(x + self.SVG_harp_size[0]) :.2f}" y="0%"'
-                                          f' width="{(100.0 * self.SVG_harp_size[0] / self.SVG_line_width) :.2f}%" height="100%">'
-                                         )
-                    instrument_render += f'\n<text x="2%" y="98%" class="repeat">x{instrument.get_repeat()} </text></svg>'
-
-                    x += self.SVG_harp_spacings[0]
-
-                line_render += "\n" + instrument_render
-                instrument_index += 1
-                x += self.SVG_harp_size[0] + self.SVG_harp_spacings[0]
+            # Lines written at the same place with the same instruments are reused
+            fragment_key = (self.aspect_ratio, self.harp_AspectRatio, self.use_symbols, row, start_col, y, ysong, instrument_index,
+                            svg_lines.get_line_key(line[start_col:]))
+            fragment = svg_lines.get(fragment_key)
+            if fragment is None:
+                fragment = self.write_line(line, row, start_col, y, ysong, instrument_index, instrument_renderer)
+                svg_lines.put(fragment_key, fragment)
+            else:
+                for col in range(start_col, fragment[4]):
+                    line[col].set_index(instrument_index + col - start_col)
+            (line_render, x, y, instrument_index, end_col, page_break, symbols) = fragment
+            svg_buffer.write(line_render)
+            page_symbols.update(symbols)
 
             #end loop on cols
             
             if num_lines > 10 and linetype in instruments.HARPS:
                 line_num_str = f'{non_voice_row :d}'
-                line_render += (f'\n<svg x="{x :.2f}" y="0%" width="{len(line_num_str)}em" height="100%">'
-                               )
-                line_render += f'\n<text x="2%" y="98%" class="num">{line_num_str}</text>'
-                line_render += '</svg>\n'
+                svg_buffer.write(f'\n<svg x="{x :.2f}" y="0%" width="{len(line_num_str)}em" height="100%">')
+                svg_buffer.write(f'\n<text x="2%" y="98%" class="num">{line_num_str}</text>')
+                svg_buffer.write('</svg>\n')
                 x += self.SVG_text_height*3/2
                 non_voice_row += 1
             
-            line_render += '\n</svg>'  # Closes last instrument-line SVG
-            song_render += line_render
+            svg_buffer.write('\n</svg>')  # Closes last instrument-line SVG
             prev_line = linetype
             
             if page_break:
@@ -290,17 +354,24 @@ class SvgSongRenderer(song_renderer.SongRenderer):
                 break
         #End loop on rows  
               
-        song_render += '\n</svg>'  # Close song SVG
+        svg_buffer.write('\n</svg>')  # Close song SVG
+        
+        # Harps drawn on this page
+        if page_symbols:
+            svg_buffer.write('\n<defs>')
+            for (symbol_id, symbol_content) in page_symbols.items():
+                svg_buffer.write(f'\n<symbol id="{symbol_id}">{symbol_content}\n</symbol>')
+            svg_buffer.write('\n</defs>')
         
-        svg_buffer.write(song_render)
         svg_buffer.write('\n</svg>')  # Close file SVG
 
-        svg_buffer.seek(0)
-        buffer_list.append(svg_buffer)
-
+        if isinstance(svg_buffer, io.StringIO):
+            svg_buffer.seek(0)
         
-        # Open new file
+        # Start of the next file
         if end_row < song.get_num_lines() or 0 < end_col < ncols:
-            buffer_list = self.write_buffers(song, css_mode, end_row, end_col, buffer_list)
+            next_start = (end_row, end_col)
+        else:
+            next_start = None
 
-        return buffer_list
+        return (svg_buffer, next_start)
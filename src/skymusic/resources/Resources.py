@@ -25,6 +25,7 @@ def load_theme(theme):
     '''
     global PNGS, CSS, SVG, THEMES
     global font_color, png_color, text_bkg, song_bkg, hr_color
+    global loaded_theme
     
     if theme not in THEMES:
         load_theme(get_default_theme())
@@ -70,6 +71,7 @@ def load_theme(theme):
         song_bkg = COLORS[theme]['song_bkg']  
         hr_color = COLORS[theme]['hr_color']
         
+        loaded_theme = theme
         THEMES[theme] = True
 
 
@@ -101,6 +103,9 @@ SVG = {'template': io.StringIO()}
 PNGS = dict()
 #Will be populated by load_theme()
 
+loaded_theme = None
+#Name of the theme whose files are currently in PNGS, CSS and SVG
+
 
 COLORS = {
         'light': {'font_color': (0, 0, 0),
@@ -140,6 +145,17 @@ png_h1_font_size = 48
 png_h2_font_size = 42
 png_font_size = 36
 png_compress = 6
+png_num_workers = 1 # Number of processes rendering PNG pages in parallel
+png_pool_min_pages = 4 # Songs with fewer pages are rendered in the main process, as starting the worker processes would take longer
+png_line_cache_size = 16*1024*1024 # Bytes of compressed PNG lines kept in memory to be reused by the next renders, 0 disables the cache
+png_sprite_cache_size = 32*1024*1024 # Bytes of rendered PNG harps kept in memory to be pasted again, 0 disables the cache
+parse_num_workers = 1 # Number of processes parsing chunks of text songs in parallel
+midi_num_workers = 1 # Number of processes converting the tracks of MIDI files in parallel
+webp_effort = 80 # Lossless WebP compression effort, from 0 (fastest) to 100 (smallest)
+webp_method = 4 # Lossless WebP encoder method, from 0 (fastest) to 6 (smallest)
+
+svg_use_symbols = False # Draws each distinct harp once in a <symbol> of SVG files
+midi_use_mido = False # Writes MIDI files with mido instead of the built-in writer
 
 MAX_FILENAME_LENGTH = 127
 MAX_NUM_FILES = 15
@@ -163,6 +179,8 @@ DELIMITERS = {'icon': ' ',
 SKYJSON_CHORD_DELAY = 50 #Delay in ms below which 2 notes are considered a chord
 DEFAULT_BPM = 220
 PARSING_START_OCTAVE = 1
+PARSE_CHUNK_SIZE = 500 # Number of song lines parsed at once by each process, when parsing in parallel
+DETECT_MODE_SAMPLE = 256 # Number of chords read between two checks of the input mode ranking during detection
 RENDERING_START_OCTAVE = 4
 
 MUSIC_MAKER_NAME = 'music_sheet_maker'
@@ -180,4 +198,6 @@ DEFAULT_INSTRUMENT = 'harp'
 
 MIDI_PITCHES = {'C': 60, 'C#': 61, 'Db': 61, 'D': 62, 'D#': 63, 'Eb': 63, 'E': 64, 'F': 65, 'F#': 66, 'Gb': 66, 'G': 67, 'G#': 68, 'Ab': 68, 'A': 69, 'A#': 70, 'Bb': 70, 'B': 71}
 MIDI_SEMITONES = [0, 2, 4, 5, 7, 9, 11]  # May no longer be used when Western_scales is merged
+MIDI_KEY_SIGNATURES = {'Cb': (-7, 0), 'Gb': (-6, 0), 'Db': (-5, 0), 'Ab': (-4, 0), 'Eb': (-3, 0), 'Bb': (-2, 0), 'F': (-1, 0), 'C': (0, 0), 'G': (1, 0), 'D': (2, 0), 'A': (3, 0), 'E': (4, 0), 'B': (5, 0), 'F#': (6, 0), 'C#': (7, 0),
+                       'Abm': (-7, 1), 'Ebm': (-6, 1), 'Bbm': (-5, 1), 'Fm': (-4, 1), 'Cm': (-3, 1), 'Gm': (-2, 1), 'Dm': (-1, 1), 'Am': (0, 1), 'Em': (1, 1), 'Bm': (2, 1), 'F#m': (3, 1), 'C#m': (4, 1), 'G#m': (5, 1), 'D#m': (6, 1), 'A#m': (7, 1)} # (sharps or -flats, minor) of the MIDI key_signature event
 
@@ -4,6 +4,8 @@ from skymusic.resources import Resources
 
 class PseudoInstrument():
 
+    __slots__ = ('type', 'index', 'repeat')
+    
     def __init__(self):
         self.type = None #mandatory
         self.index = 0 # mandatory to avoid errors
@@ -29,6 +31,7 @@ class PseudoInstrument():
         
 class Ruler(PseudoInstrument):
     
+    __slots__ = ('code', 'text', 'emphasis')
     codes = Resources.MARKDOWN_CODES['rulers']
     
     def __init__(self):
@@ -69,6 +72,10 @@ class Ruler(PseudoInstrument):
     def get_code(self):
         return self.code
 
+    def get_render_key(self):
+        """Returns a hashable summary of everything that changes the rendering of the ruler, except its index"""
+        return (self.type, self.repeat, self.code, self.text, self.emphasis)
+
     def __len__(self):
         return len(self.code)
 
@@ -80,6 +87,7 @@ class Ruler(PseudoInstrument):
         
 class Layer(Ruler):
     
+    __slots__ = ()
     codes = [Resources.DELIMITERS['layer']]
     
     def __init__(self):
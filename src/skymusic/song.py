@@ -1,6 +1,6 @@
 from skymusic import instruments, Lang
 from skymusic.renderers.song_renderers import html_sr, svg_sr, png_sr, midi_sr, skyjson_sr, ascii_sr
-from skymusic.modes import RenderMode
+from skymusic.modes import RenderMode, ImageFormat
 from skymusic.resources import Resources
 
 class Song():
@@ -16,6 +16,7 @@ class Song():
         self.locale = locale
 
         self.lines = []        
+        self.stats = None # Counts of instruments, broken instruments etc, updated by add_line
         self.meta = {
                     'title': [Lang.get_string("song_meta/title", self.locale) + ': ', Lang.get_string("song_meta/untitled", self.locale)],
                     'artist': [Lang.get_string("song_meta/artist", self.locale) + ': ', ''],
@@ -30,7 +31,47 @@ class Song():
 
     def add_line(self, line):
         """Adds a line of Instrument to the Song"""
-        if len(line) > 0: self.lines.append(line)
+        if len(line) > 0:
+            self.lines.append(line)
+            if self.stats is not None and self.stats['num_lines'] == len(self.lines) - 1:
+                self.__add_line_stats__(self.stats, line)
+            else:
+                self.stats = None
+
+    def __add_line_stats__(self, stats, line):
+        """Updates the statistics of the Song with a new line"""
+        stats['num_lines'] += 1
+        stats['num_instruments'] += len(line)
+        stats['max_instruments_per_line'] = max(stats['max_instruments_per_line'], len(line))
+        for harp in line:
+            try:
+                stats['num_broken'] += int(harp.get_is_broken())
+            except:
+                pass
+        if stats['harp_aspect_ratio'] is None:
+            try:
+                stats['harp_aspect_ratio'] = line[0].get_aspect_ratio()
+            except AttributeError:
+                pass
+        if stats['harp_type'] is None and line[0].get_type().lower() in instruments.HARPS:
+            stats['harp_type'] = line[0].get_type()
+
+    def get_stats(self):
+        """
+        Returns the statistics of the Song, which are calculated once and then updated by add_line.
+        They are calculated again if lines were added to the list returned by get_lines
+        """
+        if self.stats is None or self.stats['num_lines'] != len(self.lines):
+            stats = {'num_lines': 0, 'num_instruments': 0, 'num_broken': 0, 'max_instruments_per_line': 0,
+                     'harp_aspect_ratio': None, 'harp_type': None}
+            for line in self.lines:
+                self.__add_line_stats__(stats, line)
+            self.stats = stats
+        return self.stats
+
+    def invalidate_stats(self):
+        """To be called after the lines or the instruments of the Song were modified in place"""
+        self.stats = None
 
     def get_line(self, row):
         """Returns line #row, if row is in the Song, or else returns an empty list"""
@@ -67,53 +108,27 @@ class Song():
 
     def get_num_instruments(self):
         """Returns the number of instruments in the Song"""
-        c = 0
-        for line in self.lines:
-            c += len(line)
-        return c
+        return self.get_stats()['num_instruments']
 
     def get_harp_aspect_ratio(self):        
         
-        aspect_ratio = 1
-        
-        if self.get_num_instruments() == 0:
-            return aspect_ratio
+        aspect_ratio = self.get_stats()['harp_aspect_ratio']
         
-        for line in self.lines:
-            harp = line[0]
-            try:
-                aspect_ratio = harp.get_aspect_ratio()
-                break
-            except AttributeError:
-                pass
-                
-        return aspect_ratio
+        return 1 if aspect_ratio is None else aspect_ratio
 
     def get_harp_type(self):
 
-        for line in self.lines:
-            if line[0].get_type().lower() in instruments.HARPS:
-                return line[0].get_type()
+        harp_type = self.get_stats()['harp_type']
         
-        return 'harp'            
+        return 'harp' if harp_type is None else harp_type
 
     def get_num_broken(self):
         """Returns the number of broken instruments in the Song"""
-        b = 0
-        for line in self.lines:
-            for harp in line:
-                try:
-                    b += int(harp.get_is_broken())
-                except:
-                    pass
-        return b
+        return self.get_stats()['num_broken']
 
     def get_max_instruments_per_line(self):
         """Returns the number of instruments in the longest line"""
-        if len(self.lines) > 0:
-            return max(list(map(len, self.lines)))
-        else:
-            return 0     
+        return self.get_stats()['max_instruments_per_line']
     
     def get_meta(self):
         
@@ -150,19 +165,49 @@ class Song():
             theme = kwargs['theme']
         except KeyError:
             theme = Resources.get_default_theme()
+
+        try:
+            num_workers = kwargs['num_workers']
+        except KeyError:
+            num_workers = None
+
+        try:
+            max_files = kwargs['max_files']
+        except KeyError:
+            max_files = None
+
+        try:
+            image_format = kwargs['image_format']
+        except KeyError:
+            image_format = ImageFormat.PNG
+
+        try:
+            use_symbols = kwargs['use_symbols']
+        except KeyError:
+            use_symbols = None
+
+        try:
+            use_mido = kwargs['use_mido']
+        except KeyError:
+            use_mido = None
+
+        try:
+            lines = kwargs['lines'] # An iterable of lines read instead of the song lines, by the MIDI, SKYJSON and text renderers
+        except KeyError:
+            lines = None
         
         if render_mode == RenderMode.HTML:
             buffers = html_sr.HtmlSongRenderer(locale=self.locale, theme=theme).write_buffers(song=self, css_mode=kwargs['css_mode'])
         elif render_mode == RenderMode.SVG:
-            buffers = svg_sr.SvgSongRenderer(locale=self.locale, aspect_ratio=aspect_ratio, theme=theme).write_buffers(song=self, css_mode=kwargs['css_mode'])
+            buffers = svg_sr.SvgSongRenderer(locale=self.locale, aspect_ratio=aspect_ratio, theme=theme, max_files=max_files, use_symbols=use_symbols).write_buffers(song=self, css_mode=kwargs['css_mode'])
         elif render_mode == RenderMode.PNG:
-            buffers = png_sr.PngSongRenderer(locale=self.locale, aspect_ratio=aspect_ratio, theme=theme).write_buffers(song=self)
+            buffers = png_sr.PngSongRenderer(locale=self.locale, aspect_ratio=aspect_ratio, theme=theme, num_workers=num_workers, max_files=max_files, image_format=image_format).write_buffers(song=self)
         elif render_mode == RenderMode.MIDI:
-            buffers = midi_sr.MidiSongRenderer(self.locale, kwargs['song_bpm']).write_buffers(song=self)
+            buffers = midi_sr.MidiSongRenderer(self.locale, kwargs['song_bpm'], use_mido=use_mido).write_buffers(song=self, lines=lines)
         elif render_mode == RenderMode.SKYJSON:
-            buffers = skyjson_sr.SkyjsonSongRenderer(self.locale, kwargs['song_bpm']).write_buffers(song=self)    
+            buffers = skyjson_sr.SkyjsonSongRenderer(self.locale, kwargs['song_bpm']).write_buffers(song=self, lines=lines)    
         else:  # Ascii
-            buffers = ascii_sr.AsciiSongRenderer(self.locale).write_buffers(song=self, render_mode=render_mode)
+            buffers = ascii_sr.AsciiSongRenderer(self.locale).write_buffers(song=self, render_mode=render_mode, lines=lines)
 
         return buffers
        
@@ -0,0 +1,34 @@
+import os, sys
+import pytest
+
+# Runs the tests on the sources, without installing the package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from skymusic.parsers.song_parser import SongParser
+
+SONGS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_songs')
+
+
+class Maker():
+    """The parts of MusicSheetMaker used by the parsers"""
+    def __init__(self):
+        self.song_parser = SongParser(self)
+
+    def get_locale(self):
+        return 'en_US'
+
+    def get_song_parser(self):
+        return self.song_parser
+
+
+@pytest.fixture
+def song_parser():
+    return Maker().get_song_parser()
+
+
+@pytest.fixture
+def read_song_lines():
+    def read_song_lines(filename):
+        with open(os.path.join(SONGS_DIR, filename), encoding='utf-8') as fp:
+            return fp.read().split('\n')
+    return read_song_lines
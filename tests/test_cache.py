@@ -0,0 +1,73 @@
+import pytest
+
+from skymusic.cache import LRUCache
+from skymusic.instruments import Harp, Drum, Skygrid, SkygridPool
+from skymusic.modes import InputMode
+
+
+def test_least_recently_used_entries_are_dropped():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert len(cache) == 2
+    assert cache.get_stats()['hits'] == 3 and cache.get_stats()['misses'] == 1
+
+
+def test_cache_is_bounded_by_the_size_of_its_values():
+    cache = LRUCache(max_size=10, get_size=len)
+    cache.put('a', b'1234')
+    cache.put('b', b'123456')
+    cache.put('c', b'12')
+    
+    assert cache.get('a') is None
+    assert cache.get_stats()['total_size'] == 8
+    
+    cache.put('d', b'12345678901') # Larger than the whole cache
+    assert cache.get('d') is None
+    assert cache.get_stats()['total_size'] == 8
+    
+    cache.resize(3)
+    assert len(cache) == 1 and cache.get('c') == b'12'
+
+
+def test_empty_cache_is_disabled():
+    cache = LRUCache(max_size=0)
+    cache.put('a', 1)
+    
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_skygrid_pool_shares_identical_skygrids():
+    pool = SkygridPool()
+    skygrids = [Skygrid(), Skygrid(), Skygrid()]
+    skygrids[0].set_note((0, 1), 0)
+    skygrids[1].set_note((0, 1), 0)
+    skygrids[2].set_note((1, 1), 0)
+    
+    shared = [pool.intern(skygrid) for skygrid in skygrids]
+    
+    assert shared[0] is shared[1] is skygrids[0]
+    assert shared[2] is skygrids[2]
+    assert all(skygrid.is_shared for skygrid in shared)
+    assert len(pool) == 2
+
+
+def test_parsed_harps_use_the_pooled_skygrids(song_parser):
+    song_parser.set_input_mode(InputMode.ENGLISH)
+    
+    song = song_parser.parse_song(['C1 D1 C1'], 'C', 0)
+    harps = [song.get_instrument(0, col) for col in range(3)]
+    
+    assert harps[0].skygrid is harps[2].skygrid
+    assert all(harp.skygrid.is_shared for harp in harps)
+
+
+def test_harp_checks_the_shape_of_its_skygrid():
+    with pytest.raises(ValueError):
+        Drum(skygrid=Skygrid(shape=Harp.shape))
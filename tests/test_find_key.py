@@ -0,0 +1,43 @@
+import pytest
+
+from skymusic.modes import InputMode
+
+
+def count_broken_notes(note_parser, song_lines, song_key):
+    """Counts the broken notes of a song in a key by calculating the coordinate of each note, as the parser does"""
+    (num_out, num_notes) = (0, 0)
+    for line in song_lines:
+        notes = note_parser.note_name_regex.sub(' \\1', note_parser.not_note_name_regex.sub('', line)).split()
+        for note in notes:
+            try:
+                note_parser.calculate_coordinate_for_note(note, song_key, note_shift=0, is_finding_key=True)
+            except KeyError:
+                num_out += 1
+            except SyntaxError:
+                continue
+            num_notes += 1
+    return (num_out, num_notes)
+
+
+@pytest.mark.parametrize('input_mode', [InputMode.ENGLISH, InputMode.ENGLISHCHORDS, InputMode.DOREMI, InputMode.JIANPU])
+@pytest.mark.parametrize('song_lines', [['C D E F G A B C2', 'D E F# G A B C#2 D2', 'Bb C D Eb F G A'],
+                                        ['A1 B1 C#2 D2 E2 F#2 G#2 A2 X', 'do re mi fa sol la si', '1 2 3 4 5 6 7 #1']])
+def test_notes_out_of_key_are_counted_like_the_parser(song_parser, input_mode, song_lines):
+    song_parser.set_input_mode(input_mode)
+    note_parser = song_parser.get_note_parser()
+    note_counts = {}
+    for line in song_lines:
+        for note in note_parser.note_name_regex.sub(' \\1', note_parser.not_note_name_regex.sub('', line)).split():
+            note_counts[note] = note_counts.get(note, 0) + 1
+    
+    histogram = note_parser.get_pitch_histogram(note_counts)
+    
+    for song_key in note_parser.get_chromatic_scale():
+        num_out = note_parser.count_notes_out_of_key(histogram, song_key)
+        assert (num_out, sum(histogram.values())) == count_broken_notes(note_parser, song_lines, song_key)
+
+
+def test_find_key_of_a_song(song_parser):
+    song_parser.set_input_mode(InputMode.ENGLISH)
+    
+    assert song_parser.find_key(['G A B C D E F#', 'G2 F#1 D1 B1']) == ['G']
@@ -0,0 +1,72 @@
+import random
+import pytest
+
+pytest.importorskip('numpy')
+
+from skymusic.parsers import music_theory
+
+
+def make_note_times(seed):
+    rng = random.Random(seed)
+    beat = rng.choice([60, 120, 240, 480])
+    times = []
+    t = 0
+    for i in range(rng.randint(2, 300)):
+        t += rng.choice([beat, beat, beat//2, 2*beat, 0, rng.randint(0, 3*beat)])
+        times.append(t)
+    return (times, beat//4)
+
+
+def run_both(monkeypatch, function):
+    """Returns the results of function with the pure-Python code, then with NumPy"""
+    results = []
+    for no_numpy in (True, False):
+        monkeypatch.setattr(music_theory, 'no_numpy_module', no_numpy)
+        results.append(function(music_theory.MusicTheory(song_parser=None)))
+    return results
+
+
+def assert_close(values, numpy_values):
+    assert len(values) == len(numpy_values)
+    assert values == pytest.approx(numpy_values, rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_numpy_histogram_is_the_same(monkeypatch, seed):
+    (times, _) = make_note_times(seed)
+    dtimes = [times[i] - times[i-1] for i in range(1, len(times))]
+    
+    (histogram, numpy_histogram) = run_both(monkeypatch, lambda theory: theory.build_histogram(dtimes, 1))
+    
+    assert histogram == numpy_histogram
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_numpy_spectrum_is_the_same(monkeypatch, seed):
+    (times, _) = make_note_times(seed)
+    
+    def spectrum(theory):
+        (t, h) = theory.build_histogram(times[:128], 1)
+        return theory.spectrum(t, h)
+    ((f, sp), (numpy_f, numpy_sp)) = run_both(monkeypatch, spectrum)
+    
+    assert f == numpy_f
+    assert_close(sp, numpy_sp)
+
+
+@pytest.mark.parametrize('seed', range(50))
+@pytest.mark.parametrize('method', ['diff', 'spectrum'])
+def test_numpy_tempo_peaks_are_the_same(monkeypatch, seed, method):
+    (times, chord_delay) = make_note_times(seed)
+    
+    def analyze_tempo(theory):
+        try:
+            return theory.analyze_tempo(times, chord_delay, method)
+        except ValueError as err: # No peak when all the notes are too close
+            return type(err)
+    (peaks, numpy_peaks) = run_both(monkeypatch, analyze_tempo)
+    
+    if isinstance(peaks, type):
+        assert peaks == numpy_peaks
+    else:
+        assert_close(peaks, numpy_peaks)
@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip('PIL')
+
+from skymusic.resources import Resources
+from skymusic.instruments import Harp
+from skymusic.renderers.instrument_renderers import png_ir
+
+
+@pytest.fixture(autouse=True)
+def harp_sprites():
+    Resources.load_theme(Resources.get_default_theme())
+    png_ir.harp_sprites.clear()
+    return png_ir.harp_sprites
+
+
+def make_harp(coords, repeat=1):
+    harp = Harp()
+    for coord in coords:
+        harp.skygrid.set_note(coord, 0)
+    harp.set_is_silent(False)
+    harp.set_repeat(repeat)
+    return harp
+
+
+def test_same_chord_with_different_repeats_shares_one_sprite(harp_sprites):
+    renderer = png_ir.PngInstrumentRenderer(locale='en_US')
+    
+    sprites = [renderer.render_harp(make_harp([(0, 0), (1, 2)], repeat)) for repeat in (1, 2, 3)]
+    
+    assert sprites[0] is sprites[1] is sprites[2]
+    assert len(harp_sprites) == 1
+
+
+def test_different_chords_have_different_sprites(harp_sprites):
+    renderer = png_ir.PngInstrumentRenderer(locale='en_US')
+    
+    renderer.render_harp(make_harp([(0, 0)]))
+    renderer.render_harp(make_harp([(0, 1)]))
+    broken_harp = make_harp([(0, 0)])
+    broken_harp.set_is_broken()
+    renderer.render_harp(broken_harp)
+    
+    assert len(harp_sprites) == 3
+
+
+def test_sprites_are_bounded_in_bytes(harp_sprites):
+    renderer = png_ir.PngInstrumentRenderer(locale='en_US')
+    sprite = renderer.render_harp(make_harp([(0, 0)]))
+    sprite_size = len(sprite.getbands())*sprite.width*sprite.height
+    harp_sprites.resize(2*sprite_size)
+    
+    for col in range(1, 5):
+        renderer.render_harp(make_harp([(0, col)]))
+    
+    assert len(harp_sprites) == 2
+    assert harp_sprites.get_stats()['total_size'] == 2*sprite_size
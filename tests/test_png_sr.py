@@ -0,0 +1,77 @@
+import io, random
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from skymusic.modes import ImageFormat, InputMode
+from skymusic.resources import Resources
+from skymusic.renderers.song_renderers import png_sr
+from skymusic.renderers.song_renderers.png_sr import PngSongRenderer
+
+
+def make_page(num_colors, opaque=True, size=(120, 80), seed=0):
+    rng = random.Random(seed)
+    colors = [(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255 if opaque else rng.randrange(256))
+              for _ in range(num_colors)]
+    page = Image.new('RGBA', size)
+    page.putdata([rng.choice(colors) for _ in range(size[0]*size[1])])
+    return page
+
+
+def test_palette_png_has_256_colors_at_most():
+    renderer = PngSongRenderer(locale='en_US', image_format=ImageFormat.PALETTE_PNG)
+    page = make_page(1000, opaque=False)
+    
+    saved_page = Image.open(renderer.save_page(page))
+    assert saved_page.mode == 'P'
+    assert saved_page.size == page.size
+    assert len(saved_page.convert('RGBA').getcolors(256)) <= 256
+
+
+def test_palette_png_keeps_few_colors():
+    renderer = PngSongRenderer(locale='en_US', image_format=ImageFormat.PALETTE_PNG)
+    page = make_page(3)
+    
+    saved_page = Image.open(renderer.save_page(page)).convert('RGBA')
+    assert saved_page.tobytes() == page.tobytes()
+
+
+def make_song_lines(num_lines, edited_line=None):
+    """Returns the lines of a song where all the lines are different, with one line replaced if edited_line is given"""
+    notes = ['C', 'D', 'E', 'F', 'G', 'A', 'B']
+    song_lines = []
+    for i in range(num_lines):
+        digits = [(i // 7**j) % 7 for j in range(3)]
+        chords = [notes[digit] + notes[(digit+2) % 7] for digit in digits] + ['C1E1', 'G1', 'B1D2']
+        song_lines.append('A2B2' if i == edited_line else ' '.join(chords))
+    return song_lines
+
+
+def test_only_edited_line_is_drawn_again(song_parser):
+    png_lines = png_sr.png_lines
+    png_lines.clear()
+    song_parser.set_input_mode(InputMode.ENGLISH)
+    
+    song = song_parser.parse_song(make_song_lines(40), 'C', 0)
+    PngSongRenderer(locale='en_US').write_buffers(song)
+    first_stats = png_lines.get_stats()
+    assert first_stats['misses'] >= 40
+    
+    song = song_parser.parse_song(make_song_lines(40, edited_line=20), 'C', 0)
+    PngSongRenderer(locale='en_US').write_buffers(song)
+    second_stats = png_lines.get_stats()
+    assert second_stats['misses'] - first_stats['misses'] == 1
+    assert second_stats['hits'] - first_stats['hits'] == first_stats['hits'] + first_stats['misses'] - 1
+
+
+def test_pages_drawn_in_worker_processes_are_the_same(song_parser, monkeypatch):
+    monkeypatch.setattr(Resources, 'png_pool_min_pages', 2)
+    song_parser.set_input_mode(InputMode.ENGLISH)
+    song = song_parser.parse_song(make_song_lines(12), 'C', 0)
+    
+    pages = [page.getvalue() for page in PngSongRenderer(locale='en_US').write_buffers(song)]
+    png_sr.png_lines.clear()
+    pool_pages = [page.getvalue() for page in PngSongRenderer(locale='en_US', num_workers=2).write_buffers(song)]
+    
+    assert len(pages) > 1
+    assert pool_pages == pages
@@ -0,0 +1,33 @@
+import io, re
+
+from skymusic.modes import InputMode
+from skymusic.renderers.song_renderers.svg_sr import SvgSongRenderer
+
+
+def test_write_files_with_fewer_files_than_pages(song_parser, read_song_lines):
+    song_lines = read_song_lines('brackets.txt')
+    song_parser.set_input_mode(song_parser.get_possible_modes(song_lines)[0])
+    song = song_parser.parse_song(song_lines, 'C', 0)
+    
+    pages = SvgSongRenderer(locale='en_US').write_buffers(song)
+    assert len(pages) > 1
+    
+    svg_file = io.StringIO()
+    written = SvgSongRenderer(locale='en_US').write_files(song, [svg_file])
+    
+    assert written[0] is svg_file
+    assert [page.getvalue() for page in written] == [page.getvalue() for page in pages]
+
+
+def test_symbols_keep_the_classes_of_broken_and_silent_harps(song_parser):
+    song_parser.set_input_mode(InputMode.ENGLISH)
+    song = song_parser.parse_song(['C1 . X9 C1'], 'C', 0)
+    
+    page = SvgSongRenderer(locale='en_US', use_symbols=True).write_buffers(song)[0].getvalue()
+    
+    # One bare <use> per harp, and the CSS classes on the <svg> inside each <symbol>
+    uses = re.findall(r'<use xlink:href="#(harp-\w+)"[^>]* id="instr-\d+" />', page)
+    assert len(uses) == 4
+    assert uses[0] == uses[3]
+    symbol_classes = dict(re.findall(r'<symbol id="(harp-\w+)">\s*<svg [^>]*class="([^"]*)">', page))
+    assert [symbol_classes[symbol_id] for symbol_id in uses] == ['instr harp', 'instr harp silent', 'instr harp broken', 'instr harp']